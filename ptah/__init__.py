@@ -3,7 +3,6 @@
 from enum import Enum
 import os
 import os.path
-import yaml
 from ptah import format
 from ptah import props
 from ptah.props import Property, Map, Container, StringProperty
@@ -16,30 +16,26 @@
 #	along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
-"""Ptah command."""
+"""Ptah command.
+
+To start quickly, heavy modules (YAML, album model, LaTeX back-end, PIL)
+are only imported by the code paths that need them."""
 
 import argparse
-from importlib.metadata import version, PackageNotFoundError
-import re
-import subprocess
+import os.path
 import sys
-import yaml
 
-from ptah import graph
 from ptah import io
-from ptah import format
 from ptah import util
-from ptah import latex
-from ptah import props
-from ptah.album import Album
-import ptah.pages
 
 
-# get version
-try:
-	__version__ = version("ptah")
-except PackageNotFoundError:
-	__version__ = "0.0.0"
+def get_version():
+	"""Get the version of ptah."""
+	from importlib.metadata import version, PackageNotFoundError
+	try:
+		return version("ptah")
+	except PackageNotFoundError:
+		return "0.0.0"
 
 
 # formats
@@ -70,7 +66,8 @@ def main(mon = io.DEF):
 		prog = "ptah",
 		description = "Photo album generator"
 	)
-	parser.add_argument('albums', nargs="*", help="Album to generate.")
+	parser.add_argument('albums', nargs="*",
+		help="Album to generate or init DIR to generate an album from the photos of DIR.")
 	parser.add_argument("--doc", action="store_true",
 		help="Generate the documentation.")
 	parser.add_argument("--debug", action="store_true",
@@ -79,6 +76,28 @@ def main(mon = io.DEF):
 		help="Display the album for debugging.")
 	parser.add_argument("--version", action="store_true",
 		help="Display the version.")
+	parser.add_argument("--json-schema", action="store_true",
+		help="Output the JSON Schema of the album files.")
+	parser.add_argument("--backend", default="latex",
+		help="Back-end used to generate the albums (default latex).")
+	parser.add_argument("--profile", action="store_true",
+		help="Display profiling information.")
+	parser.add_argument("--json-log", action="store_true",
+		help="Output messages as JSON lines.")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+		help="Number of volumes generated in parallel.")
+	parser.add_argument("--check", action="store_true",
+		help="Only read and check the albums.")
+	parser.add_argument("--validate", action="store_true",
+		help="Only check the generated LaTeX in draft mode (no image, no PDF).")
+	parser.add_argument("--pages",
+		help="Only generate the given pages (like 3,10-12,cover) in XXX-partial.pdf.")
+	parser.add_argument("--expand", action="store_true",
+		help="Write the album with its flow expanded in pages to XXX-expanded.ptah.")
+	parser.add_argument("--gap", type=float,
+		help="With init, group photos separated by at most this time in minutes (default: by day).")
+	parser.add_argument("--force", action="store_true",
+		help="With init, overwrite an existing album.")
 
 	args = parser.parse_args()
 	albums = args.albums
@@ -88,32 +107,96 @@ def main(mon = io.DEF):
 	# generic options
 	if args.debug:
 		util.DEBUG = True
+	if args.profile:
+		util.PROFILE = True
+	if args.json_log:
+		mon.json = True
 
 	# version case
 	if args.version:
-		print(f"ptah V{__version__}, copyright (c) 2025 H. Cassé <hug.casse@gmail.com>")
+		print(f"ptah V{get_version()}, copyright (c) 2025 H. Cassé <hug.casse@gmail.com>")
 		sys.exit(0)
 
 	# generate the documentation
 	if args.doc:
+		from ptah import latex
 		latex.gen_doc()
 
+	# output the JSON schema
+	elif args.json_schema:
+		import json
+		from ptah import schema
+		json.dump(schema.album_json(), sys.stdout, indent=2)
+		print()
+
+	# generate an album from a directory
+	elif albums[:1] == ["init"] and not os.path.isfile("init"):
+		if len(albums) != 2:
+			mon.print_error("init requires a directory!")
+			exit(1)
+		from ptah import scan
+		gap = None if args.gap is None else args.gap * 60
+		try:
+			path = scan.init(albums[1], mon, gap=gap, force=args.force)
+			mon.print_info(f"album generated in {path}")
+		except util.CheckError as e:
+			mon.print_error(str(e))
+			exit(1)
+
 	# process the albums
 	else:
-		for path in args.albums:
+		from ptah import graph, plugin
+		from ptah.album import Album
+		Drawer = None
+		if not args.check and not args.debug_album and not args.expand:
+			try:
+				Drawer = plugin.DRAWERS.get(args.backend)
+			except KeyError:
+				mon.print_error(f"unknown back-end {args.backend}!")
+				exit(1)
+			except (ImportError, AttributeError) as e:
+				mon.print_error(f"cannot load back-end {args.backend}: {e}")
+				exit(1)
+		failed = False
+		for path in albums:
 			try:
 				album = Album(path)
 				album.read(mon)
+				pages, root = None, None
+				if args.pages is not None:
+					pages = album.select_pages(args.pages)
+					root = os.path.splitext(path)[0] + "-partial"
 				if args.debug_album:
 					album.dump()
+				elif args.expand:
+					from ptah import flow
+					mon.print_info(f"{path}: expanded in {flow.export(album)}")
+				elif args.check:
+					mon.print_info(f"{path}: checked")
+				elif args.validate:
+					if not hasattr(Drawer, "validate"):
+						mon.print_error(f"back-end {args.backend} does not support validation!")
+						exit(1)
+					errors = Drawer(album, pages, root, mon).validate()
+					for error in errors:
+						mon.print_error(f"{path}: {error}")
+					if errors:
+						failed = True
+					else:
+						mon.print_info(f"{path}: valid")
+				elif pages is not None:
+					Drawer(album, pages, root, mon).gen()
 				else:
-					latex.Drawer(album).gen()
+					from ptah import volume
+					volume.gen(album, Drawer, mon, jobs=args.jobs)
 			except util.CheckError as e:
 				mon.print_error(str(e))
 				exit(1)
 			except graph.GenError as e:
 				mon.print_error(str(e))
 				exit(2)
+		if failed:
+			exit(3)
 
 if __name__ == "__main__":
 	main()
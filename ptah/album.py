@@ -19,16 +19,23 @@
 """Representation of the album."""
 
 import os
-import yaml
+import re
 
 from ptah import format
 from ptah import graph
 from ptah import io
+from ptah import include
+from ptah import plugin
+from ptah import templates
 from ptah import util
-from ptah.props import StringProperty, Property, Map, Container, make, parse_color
+from ptah.props import StringProperty, Property, Map, Container, make, parse_color, \
+	IntProperty, SizeProperty, bool_prop, parse_file
 from ptah.gprops import *
 
 NAME_PROP = StringProperty("name", "name")
+WORK_DIR = ".ptah"
+DEFAULT_RESOLUTION = 300
+PAGE_RANGE_RE = re.compile(r"^([0-9]+)(-([0-9]*))?$")
 
 def check_dict(data, context):
 	"""Check if data are a dictionary. Raises an exception if it is not the cas
@@ -73,6 +80,7 @@ STYLES_PROP = Property("styles", "apply the named styles to the current object (
 class Frame(Map):
 	"""A frame inside a page with content."""
 
+	KIND = "frame"
 	PROPS = [
 		STYLE_PROP,
 		STYLES_PROP
@@ -113,6 +121,10 @@ class Frame(Map):
 		"""Generate the frame on the drawer."""
 		pass
 
+	def get_images(self):
+		"""Get the paths of images displayed by the frame."""
+		return []
+
 	def declare(self, drawer):
 		"""Called to declare resources used by the frame.
 		Default implementation performs property initialization
@@ -127,6 +139,7 @@ class Frame(Map):
 class Image(Frame, graph.Style):
 	"""Frame displaying an image."""
 
+	KIND = "image"
 	STYLE_PROPS = [
 		MODE_PROP,
 		SCALE_PROP,
@@ -140,7 +153,8 @@ class Image(Frame, graph.Style):
 		SHADOW_XOFFSET,
 		SHADOW_YOFFSET,
 		SHADOW_OPACITY,
-		SHADOW_COLOR
+		SHADOW_COLOR,
+		FILTER_PROP
 	]
 	PROPS = [IMAGE_PROP] + STYLE_PROPS + Frame.PROPS
 	MAP = make(PROPS)
@@ -160,11 +174,20 @@ class Image(Frame, graph.Style):
 
 	def gen(self, drawer):
 		if self.image is not None:
+			drawer.begin_frame(self)
 			drawer.draw_image(self.image, self.box, self)
 
+	def get_images(self):
+		if self.image is None:
+			return []
+		else:
+			return [self.image]
+
 	def declare(self, drawer):
 		self.init()
 		graph.Style.check(self, None)
+		if self.image is not None:
+			drawer.declare_image(self.image, self)
 		if self.border_style != BorderStyle.NONE:
 			if self.border_color is not None:
 				drawer.declare_color(self.border_color)
@@ -176,6 +199,7 @@ class Image(Frame, graph.Style):
 class Text(Frame, graph.TextStyle):
 	"""Frame displaying a text."""
 
+	KIND = "text"
 	STYLE_PROPS = [
 		TEXT_ALIGN_PROP,
 		TEXT_COLOR_PROP,
@@ -199,6 +223,7 @@ class Text(Frame, graph.TextStyle):
 
 	def gen(self, drawer):
 		if self.text is not None:
+			drawer.begin_frame(self)
 			drawer.draw_text(self.text, self.box, self)
 
 	def declare(self, drawer):
@@ -230,6 +255,7 @@ class Page(Container, graph.PageStyle):
 		graph.PageStyle.__init__(self)
 		self.name = "<no name>"
 		self.number = None
+		self.source = None
 
 	def dump(self):
 		print(f"PAGE {self.name}")
@@ -237,7 +263,10 @@ class Page(Container, graph.PageStyle):
 		Container.dump(self)
 
 	def get_location(self):
-		return f"{self.name}:{self.number + 1}"
+		if self.source is None:
+			return f"{self.name}:{self.number + 1}"
+		else:
+			return f"{self.name}:{self.number + 1} in {self.source}"
 
 	def get_album(self):
 		"""Get the album containing the page."""
@@ -247,15 +276,18 @@ class Page(Container, graph.PageStyle):
 		return self.MAP
 
 	def map(self, drawer):
-		"""Map the frames inside the page with actual size of the page."""
+		"""Map the frames inside the page with actual size of the page
+		(given by drawer.width, drawer.height and drawer.sep). Called by
+		the layout pass, it must not generate anything."""
 		pass
 
 	def gen(self, drawer):
-		"""Generate the page on the given output file."""
-		self.map(drawer)
-		for frame in self.content:
+		"""Generate the frames of the page on the given drawer, as placed
+		in the layout table of the drawer."""
+		for row in drawer.layout.get_rows(self):
+			frame = self.get_item(row.frame)
+			frame.box = graph.Box(row.x, row.y, row.w, row.h)
 			frame.gen(drawer)
-		pass
 
 	def get_props(self):
 		"""Get properties for reading the page description."""
@@ -265,6 +297,15 @@ class Page(Container, graph.PageStyle):
 		"""Get the packages used by this page."""
 		return set()
 
+	def get_images(self):
+		"""Get the paths of images used by the page, including background."""
+		res = []
+		if self.background_image is not None:
+			res.append(self.background_image)
+		for frame in self.content:
+			res += frame.get_images()
+		return res
+
 	def gen_miniature(drawer):
 		"""Called to generate the miniature when the documentation is
 		called."""
@@ -274,6 +315,8 @@ class Page(Container, graph.PageStyle):
 		"""Called to declare usd resource in the declaration phase."""
 		if self.background_color != None:
 			drawer.declare_color(self.background_color)
+		if self.background_image is not None:
+			drawer.declare_background(self)
 		for frame in self.content:
 			frame.declare(drawer)
 
@@ -284,11 +327,29 @@ class Page(Container, graph.PageStyle):
 			frame.check(mon)
 
 
+def iter_pages(pages, album, mon, source = None, stack = ()):
+	"""Produce the pairs (page description, source file) of pages, read
+	from the file source (None for the album file) included by the files
+	of stack. Include and repeat entries are expanded as they are
+	consumed."""
+	for desc in pages:
+		try:
+			if include.is_include(desc):
+				path, content = include.load_list(desc, source, album, stack)
+				yield from iter_pages(content, album, mon, path, stack + (path,))
+			elif is_dict(desc) and "repeat" in desc:
+				for page in templates.expand(desc, album):
+					yield page, source
+			else:
+				yield desc, source
+		except util.CheckError as e:
+			mon.print_error(f"{e} Ignoring it!")
+
 def parse_pages(self, pages, album, mon):
 	if not hasattr(pages, "__iter__"):
 		raise CheckError("pages should a be a list of pages!")
 	res = []
-	for desc in pages:
+	for (desc, source) in iter_pages(pages, album, mon):
 
 		# get the page type
 		try:
@@ -298,13 +359,18 @@ def parse_pages(self, pages, album, mon):
 
 		# make the page
 		try:
-			page = util.PAGE_MAP[type](album)
+			cls = plugin.PAGES.get(type)
 		except KeyError:
 			mon.print_error(f"page type {type} is unknown! Ignoring it!")
 			continue
+		except (ImportError, AttributeError) as e:
+			mon.print_error(f"cannot load page type {type}: {e}. Ignoring it!")
+			continue
+		page = cls(album)
 
 		# initialize the page
 		page.number = len(res)
+		page.source = source
 		try:
 			page.name = desc["name"]
 		except KeyError:
@@ -338,10 +404,17 @@ def parse_default(self, data, album, mon):
 	album.get_default().parse(data, mon)
 	return album.get_default()
 
-def parse_declare_styles(self, content, album, mon):
+def parse_declare_styles(self, content, album, mon, source = None, stack = ()):
 	if not is_iterable(content):
 		mon.print_error("styles at top-level must contain a list of styles!")
 	for item in content:
+		if include.is_include(item):
+			try:
+				path, included = include.load_list(item, source, album, stack)
+				parse_declare_styles(self, included, album, mon, path, stack + (path,))
+			except util.CheckError as e:
+				mon.print_error(f"{e} Ignoring it!")
+			continue
 		if not is_dict(item):
 			mon.print_error("a style must be a collection of definitions!")
 			continue
@@ -350,29 +423,61 @@ def parse_declare_styles(self, content, album, mon):
 		except KeyError:
 			mon.print_error("a style must have a name!")
 			continue
-		style = Style(name, album)
+		style = Style(name, album, source)
 		style.parse(item, io.DEF)
 		album.add_style(style)
 
-def parse_colors(self, content, album, mon):
+def parse_colors(self, content, album, mon, source = None, stack = ()):
 	"""Parse the definition of colors."""
 	if not is_dict(content):
-		mon.print_error("colors must be a list of color definitions!")
+		mon.print_error(f"colors must be a list of color definitions in {source or album.get_location()}!")
 		return
 	for (key, val) in content.items():
+		if key == include.KEY:
+			try:
+				path = include.resolve(content, source, album, stack)
+				parse_colors(self, include.load(path, album), album, mon, path, stack + (path,))
+			except util.CheckError as e:
+				mon.print_error(f"{e} Ignoring it!")
+			continue
 		pseudo = Property(key, "defined color", parse_color)
 		try:
 			color = parse_color(pseudo, val, album, mon)
 			album.add_color(key, color)
 		except util.CheckError as e:
-			mon.print_error(f"bad color {key}: {val}: {e}.")
+			mon.print_error(f"bad color {key}: {val} in {source or album.get_location()}: {e}.")
+			continue
+
+def parse_templates(self, content, album, mon):
+	"""Parse the definition of page templates."""
+	if isinstance(content, str) or not is_iterable(content):
+		raise util.CheckError("templates must be a list of page templates!")
+	for item in content:
+		if not is_dict(item) or "template" not in item:
+			mon.print_error("a page template must be a map with a template name!")
 			continue
+		desc = dict(item)
+		album.add_template(str(desc.pop("template")), desc)
+	return content
+
+def parse_flow(self, content, album, mon):
+	"""Parse the list of images of the flow."""
+	if isinstance(content, str) or not is_iterable(content) \
+	or not all([isinstance(x, str) for x in content]):
+		raise util.CheckError("flow must be a list of images!")
+	return list(content)
 
 class Album(Container):
 	"""The album itself, mainly an ordered collection of pages."""
 
 	FORMAT_PROP = Property("format", "page format", parse_format)
 	PAGES_PROP = Property("pages", "list of pages", parse_pages)
+	TEMPLATES_PROP = Property("templates",
+		"page templates usable with repeat in pages.",
+		parse_templates)
+	FLOW_PROP = Property("flow",
+		"list of images automatically split in center, duo and trio pages after the pages.",
+		parse_flow)
 	TITLE_PROP = StringProperty("title", "Album title.")
 	AUTHOR_PROP = StringProperty("author", "Author name.")
 	DATE_PROP = StringProperty("date", "Edition date.")
@@ -380,6 +485,19 @@ class Album(Container):
 	DEFAULT_PROP = Property("default", "default properties the rest of the album", parse_default)
 	DECLARE_STYLES_PROP = Property("styles", "styles usable in the rest of the album", parse_declare_styles)
 	COLORS_PROP = Property("colors", "named colors usable in the rest of the album", parse_colors)
+	MAX_PAGES_PROP = IntProperty("max-pages-per-volume",
+		"split the album in volumes of at most this number of pages (rounded to even).")
+	MAX_BYTES_PROP = SizeProperty("max-volume-bytes",
+		"split the album in volumes whose images weight at most this size (like 500M or 2G).")
+	RESOLUTION_PROP = IntProperty("resolution",
+		"resolution in DPI of the images generated by ptah (default 300).")
+	PRERENDER_TILES_PROP = bool_prop("prerender-tiles",
+		"generate tiled backgrounds as a single image instead of repeating the tile when the PDF is displayed")
+	PRERENDER_SHADOWS_PROP = bool_prop("prerender-shadows",
+		"generate fuzzy shadows as blurred images instead of stacked transparent paths")
+	OUTPUT_PROFILE_PROP = Property("output-profile",
+		"ICC profile (file) of the printer the images and colors are converted to (like CMYK profiles).",
+		parse_file)
 	STYLE_PROPS = [
 		BACKGROUND_COLOR_PROP,
 		BACKGROUND_IMAGE_PROP,
@@ -387,13 +505,21 @@ class Album(Container):
 	PROPS = make([
 		FORMAT_PROP,
 		PAGES_PROP,
+		FLOW_PROP,
+		TEMPLATES_PROP,
 		TITLE_PROP,
 		AUTHOR_PROP,
 		DATE_PROP,
 		PATHS_PROP,
 		DEFAULT_PROP,
 		DECLARE_STYLES_PROP,
-		COLORS_PROP
+		COLORS_PROP,
+		MAX_PAGES_PROP,
+		MAX_BYTES_PROP,
+		RESOLUTION_PROP,
+		PRERENDER_TILES_PROP,
+		PRERENDER_SHADOWS_PROP,
+		OUTPUT_PROFILE_PROP
 	], STYLE_PROPS)
 	MAP = make(PROPS)
 
@@ -402,6 +528,7 @@ class Album(Container):
 		Container.__init__(self, default)
 		self.path = path
 		self.pages = None
+		self.flow_pages = []
 		self.base = os.path.dirname(path)
 		if not self.base:
 			self.base = "."
@@ -416,6 +543,13 @@ class Album(Container):
 		self.default = default
 		self.styles = {}
 		self.colors = {}
+		self.templates = {}
+		self.max_pages_per_volume = None
+		self.max_volume_bytes = None
+		self.resolution = DEFAULT_RESOLUTION
+		self.prerender_tiles = False
+		self.prerender_shadows = False
+		self.output_profile = None
 
 	def dump(self):
 		"""Dump ,the album for debugging purpose."""
@@ -431,6 +565,13 @@ class Album(Container):
 		print(f"paths: {self.paths}")
 		print(f"styles: {self.styles}")
 		print(f"colors: {self.colors}")
+		print(f"templates: {list(self.templates)}")
+		print(f"max pages per volume: {self.max_pages_per_volume}")
+		print(f"max volume bytes: {self.max_volume_bytes}")
+		print(f"resolution: {self.resolution}")
+		print(f"prerender tiles: {self.prerender_tiles}")
+		print(f"prerender shadows: {self.prerender_shadows}")
+		print(f"output profile: {self.output_profile}")
 		for page in self.pages:
 			page.dump()
 
@@ -461,6 +602,14 @@ class Album(Container):
 			color = None
 		return color
 
+	def add_template(self, name, desc):
+		"""Declare a page template."""
+		self.templates[name] = desc
+
+	def get_template(self, name):
+		"""Get a page template by its name. Return None if not declared."""
+		return self.templates.get(name)
+
 	def get_default(self):
 		"""Get the album default container."""
 		return self.default
@@ -478,6 +627,13 @@ class Album(Container):
 	def get_base(self):
 		return self.base
 
+	def get_work_dir(self, name):
+		"""Get the path of a working directory of ptah, named name, in the
+		album directory. The directory is created if needed."""
+		path = os.path.join(self.base, WORK_DIR, name)
+		os.makedirs(path, exist_ok=True)
+		return path
+
 	def get_title(self):
 		if self.title is None:
 			self.title = self.get_prop(self.TITLE_PROP)
@@ -497,21 +653,72 @@ class Album(Container):
 
 	def read(self, mon):
 		"""Read the album from the file."""
-		try:
-			with open(self.path) as file:
-				desc = yaml.safe_load(file)
-				self.parse(desc, mon)
-		except (yaml.YAMLError, UnicodeDecodeError) as e:
-			raise util.CheckError(str(e))
-		except FileNotFoundError:
-			raise util.CheckError(f"cannot open {self.path}!")
+		desc = include.load(self.path, self)
+		self.parse(desc, mon)
+
+	def parse(self, data, mon):
+		"""Parse the album description. The templates are parsed first as
+		the pages use them, whatever their order in the file."""
+		if is_dict(data) and self.TEMPLATES_PROP.id in data:
+			data = dict(sorted(data.items(),
+				key=lambda item: item[0] != self.TEMPLATES_PROP.id))
+		Container.parse(self, data, mon)
 
 	def check(self, mon):
-		self.pages = self.get_prop(self.PAGES_PROP, direct=True, required=True)
+		flow = self.get_prop(self.FLOW_PROP, direct=True)
+		self.pages = self.get_prop(self.PAGES_PROP, direct=True, required=flow is None, default=[])
+		if flow is not None:
+			from ptah.flow import expand
+			self.flow_pages = expand(self, flow)
+			for page in parse_pages(self.PAGES_PROP, self.flow_pages, self, mon):
+				page.number = len(self.pages)
+				self.pages.append(page)
 		self.format = self.get_prop(self.FORMAT_PROP, default=self.format, direct=True)
 		self.title = self.get_prop(self.TITLE_PROP, default=self.title, direct=True)
 		self.author = self.get_prop(self.AUTHOR_PROP, default=self.author, direct=True)
 		self.date = self.get_prop(self.DATE_PROP, default=self.date, direct=True)
+		self.max_pages_per_volume = self.get_prop(self.MAX_PAGES_PROP, direct=True)
+		if self.max_pages_per_volume is not None and self.max_pages_per_volume < 2:
+			raise util.CheckError(f"max-pages-per-volume must be at least 2 in {self.get_location()}")
+		self.max_volume_bytes = self.get_prop(self.MAX_BYTES_PROP, direct=True)
+		self.resolution = self.get_prop(self.RESOLUTION_PROP, default=self.resolution, direct=True)
+		if self.resolution <= 0:
+			raise util.CheckError(f"resolution must be positive in {self.get_location()}")
+		self.prerender_tiles = self.get_prop(self.PRERENDER_TILES_PROP, default=self.prerender_tiles, direct=True)
+		self.prerender_shadows = self.get_prop(self.PRERENDER_SHADOWS_PROP, default=self.prerender_shadows, direct=True)
+		self.output_profile = self.get_prop(self.OUTPUT_PROFILE_PROP, direct=True)
+
+	def select_pages(self, spec):
+		"""Select pages according to the given specification, a comma separated
+		list of page numbers (starting at 1), page ranges N-M, open ranges N-
+		or page names. Return the list of selected pages in album order.
+		Raise util.CheckError if a page cannot be found."""
+		selected = set()
+		for item in spec.split(","):
+			item = item.strip()
+			if not item:
+				continue
+			m = PAGE_RANGE_RE.match(item)
+			if m is None:
+				found = [page for page in self.pages if page.name == item]
+				if not found:
+					raise util.CheckError(f"no page named {item} in {self.get_location()}")
+				selected.update(page.number for page in found)
+			else:
+				first = int(m.group(1))
+				if m.group(2) is None:
+					last = first
+				elif m.group(3):
+					last = int(m.group(3))
+				else:
+					last = len(self.pages)
+				if first < 1 or last > len(self.pages) or first > last:
+					raise util.CheckError(f"bad page range {item} in {self.get_location()}: "
+						f"pages are numbered from 1 to {len(self.pages)}")
+				selected.update(range(first - 1, last))
+		if not selected:
+			raise util.CheckError(f"no page selected in {self.get_location()}")
+		return [page for page in self.pages if page.number in selected]
 
 	def find(self, file):
 		"""Look for a file in the execution paths.
@@ -554,13 +761,17 @@ class Style(Map):
 	PROPS = Page.STYLE_PROPS + Image.STYLE_PROPS + Text.STYLE_PROPS
 	MAP = make(PROPS, NAME_PROP)
 
-	def __init__(self, name, album):
+	def __init__(self, name, album, source = None):
 		Map.__init__(self)
 		self.name = name
 		self.album = album
+		self.source = source
 
 	def get_location(self):
-		return f"style {self.name}"
+		if self.source is None:
+			return f"style {self.name}"
+		else:
+			return f"style {self.name} in {self.source}"
 
 	def get_props_map(self):
 		return self.MAP
@@ -0,0 +1,151 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Automatic pagination of a flow of images.
+
+A flow is an ordered list of images (typically sorted by capture time)
+that is split in center, duo and trio pages. The page types and their
+orientation are selected to minimize the area of the page body that is
+not covered by the images. As the fraction of the slot left empty by an
+image in fit mode is the same as the fraction of the image cropped out in
+fill mode, this also minimizes cropping.
+
+The selection is performed by dynamic programming over the aspect ratios
+of the images, read from the image metadata cache: as a page contains at
+most 3 images, the pagination is linear in the number of images."""
+
+from collections import namedtuple
+import os.path
+import yaml
+
+from ptah import images, layout, util
+
+
+Model = namedtuple("Model", ["type", "orientation", "count"])
+"""Model of page a flow may be split in: page type, orientation (or None)
+and number of images."""
+
+MODELS = [
+	Model("center", None, 1),
+	Model("duo", "vertical", 2),
+	Model("duo", "horizontal", 2),
+	Model("trio", "vertical", 3),
+	Model("trio", "horizontal", 3)
+]
+
+
+def get_slot(model, area):
+	"""Get the size (w, h) of the slots of the images of a page model in
+	the given area. Must be kept consistent with the map() of the pages."""
+	n = model.count
+	if model.orientation == "horizontal":
+		return ((area.width - (n - 1) * area.sep) / n, area.height)
+	else:
+		return (area.width, (area.height - (n - 1) * area.sep) / n)
+
+
+def get_waste(ratio, w, h):
+	"""Get the area of a slot w x h not covered by an image of the given
+	ratio in fit mode."""
+	if ratio * h > w:
+		return w * h - w * w / ratio
+	else:
+		return w * h - ratio * h * h
+
+
+def paginate(ratios, area):
+	"""Split the images of the given ratios in pages of area. Return the
+	list of (model, start, end) where [start, end[ is the range of images
+	of the page."""
+	slots = [get_slot(model, area) for model in MODELS]
+	n = len(ratios)
+	INF = float("inf")
+
+	# cost[i]: best cost for the i first images
+	cost = [0.] + [INF] * n
+	back = [None] * (n + 1)
+	for i in range(1, n + 1):
+		for (model, (w, h)) in zip(MODELS, slots):
+			j = i - model.count
+			if j < 0:
+				continue
+			c = cost[j]
+			for r in ratios[j:i]:
+				c += get_waste(r, w, h)
+			if c < cost[i]:
+				cost[i] = c
+				back[i] = model
+
+	# rebuild the pages
+	res = []
+	i = n
+	while i > 0:
+		model = back[i]
+		res.append((model, i - model.count, i))
+		i -= model.count
+	res.reverse()
+	return res
+
+
+def describe(model, paths, number, prefix = "flow"):
+	"""Build the description of a page, as in the album file, for the
+	given model, images paths and page number in the flow. The page is
+	named prefix-number."""
+	desc = {
+		"name": f"{prefix}-{number + 1}",
+		"type": model.type
+	}
+	if model.orientation is not None:
+		desc["orientation"] = model.orientation
+	if model.count == 1:
+		desc["image"] = paths[0]
+	else:
+		for (i, path) in enumerate(paths):
+			desc[f"image#{i + 1}"] = path
+	return desc
+
+
+def expand(album, paths):
+	"""Expand the flow of images paths into a list of page descriptions.
+	Raise util.CheckError if an image cannot be found."""
+	images.load_cache(album)
+	ratios = []
+	for path in paths:
+		actual = album.find(path)
+		if actual is None:
+			raise util.CheckError(f"image {path} of flow in {album.get_location()} cannot be found!")
+		ratios.append(layout.get_ratio(actual))
+	images.save_cache(album)
+	return [
+		describe(model, paths[start:end], i)
+		for (i, (model, start, end)) in enumerate(paginate(ratios, layout.Area(album.format)))
+	]
+
+
+def export(album, path = None):
+	"""Write the album description with the flow expanded in pages to path
+	(default XXX-expanded.ptah). Return the path of the written file."""
+	if path is None:
+		path = os.path.splitext(album.path)[0] + "-expanded.ptah"
+	with open(album.path) as file:
+		desc = yaml.safe_load(file)
+	desc.pop("flow", None)
+	desc["pages"] = (desc.get("pages") or []) + album.flow_pages
+	with open(path, "w") as out:
+		yaml.safe_dump(desc, out, sort_keys=False, allow_unicode=True)
+	return path
@@ -18,12 +18,14 @@
 
 """Graphic properties."""
 
+import re
+
 from ptah.props import parse_union, parse_penum, parse_length, parse_float, \
 	parse_font, parse_color, parse_percent, \
 	Property, ColorProperty, ImageProperty, StringProperty, \
 	enum_prop
 from ptah.graph import Mode, Align, BorderStyle, BorderWidth, Shadow, FontSize
-from ptah.util import enum_list
+from ptah.util import enum_list, CheckError
 
 
 parse_border_width = parse_union([
@@ -98,3 +100,28 @@ SHADOW_OPACITY = Property(
 	parse_percent)
 
 
+# filter properties
+FILTER_RE = re.compile(r"^([a-z-]+)\s*(?:\(\s*([0-9.]+)\s*\))?$")
+
+def parse_filter(self, val, obj, mon):
+	"""Parse a chain of filters as a list or a space separated string of
+	NAME or NAME(VALUE). Return a tuple of (name, value) with value None if
+	not given."""
+	from ptah.images import FILTERS
+	if isinstance(val, str):
+		val = val.replace(",", " ").split()
+	elif not isinstance(val, list):
+		raise CheckError(f"bad filter for {self.id} in {obj.get_location()}")
+	res = []
+	for item in val:
+		m = FILTER_RE.match(str(item).strip().lower())
+		if m is None or m.group(1) not in FILTERS:
+			raise CheckError(f"bad filter {item} in {obj.get_location()}")
+		arg = None if m.group(2) is None else float(m.group(2))
+		res.append((m.group(1), arg))
+	return tuple(res)
+
+FILTER_PROP = Property(
+	"filter",
+	"filters applied to the image (list or space separated) among unsharp(PERCENT), grayscale, sepia, contrast(FACTOR).",
+	parse_filter)
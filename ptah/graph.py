@@ -169,6 +169,7 @@ class Style:
 		self.shadow_yoffset = 1.5
 		self.shadow_color = "#000000"
 		self.shadow_opacity = None
+		self.filter = None
 
 	def check(self, mon):
 		if self.shadow_opacity is None:
@@ -233,6 +234,7 @@ class Drawer:
 		self.page_width = self.format.width
 		self.page_height = self.format.height
 		self.sep = self.format.column_sep
+		self.layout = None
 
 	def draw_image(self, path, box, style):
 		"""Draw an image from the given path in the given box with the
@@ -246,6 +248,21 @@ class Drawer:
 		"""Called to declare a color during the declaration phase."""
 		pass
 
+	def declare_image(self, path, style = None):
+		"""Called to declare an image during the declaration phase. style,
+		if any, is the style of the frame displaying the image."""
+		pass
+
+	def declare_background(self, page):
+		"""Called to declare the background image of a page during the
+		declaration phase."""
+		if page.background_mode != Mode.TILE:
+			self.declare_image(page.background_image)
+
+	def begin_frame(self, frame):
+		"""Called before generating a frame."""
+		pass
+
 	def draw_miniature_image(self, label, box):
 		"""Draw image for miniature output."""
 		pass
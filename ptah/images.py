@@ -0,0 +1,801 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Images derived from the album images (tiled backgrounds, shadows,
+cropped images, etc).
+
+Derived images are built with PIL in the "cache" working directory of
+the album. Their file name is a hash of their kind, of the content of
+their source images and of their parameters so that they are only built
+once across runs. As building an image is done in a thread pool, the
+path of a derived image is known as soon as it is requested but the
+factory has to be waited for before using the images."""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from io import BytesIO
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import threading
+
+from ptah import graph, io
+
+VERSION = 1
+"""Version of the derived images: changing it invalidates the cache."""
+
+SUPPORTED_FORMATS = {"jpeg", "png", "pdf"}
+"""Image formats supported by pdflatex."""
+
+LOSSLESS_FORMATS = {"gif", "bmp", "tiff"}
+"""Formats converted to PNG even if they have no transparency."""
+
+JPEGTRAN_OPTIONS = {
+	2: ["-flip", "horizontal"],
+	3: ["-rotate", "180"],
+	4: ["-flip", "vertical"],
+	5: ["-transpose"],
+	6: ["-rotate", "90"],
+	7: ["-transverse"],
+	8: ["-rotate", "270"]
+}
+"""jpegtran options to apply an EXIF orientation."""
+
+JPEGTRAN = shutil.which("jpegtran")
+"""Path of jpegtran used to rotate losslessly JPEG images, None if not available."""
+
+OPENER_LOCK = threading.Lock()
+OPENERS_REGISTERED = False
+
+
+class Store:
+	"""Persistent map of information about files, saved as a JSON file
+	in the cache directory. Entries are keyed by the path, the modification
+	time and the size of the file."""
+
+	def __init__(self, name):
+		self.name = name
+		self.map = {}
+		self.lock = threading.Lock()
+		self.loaded = set()
+
+	def get_key(self, path):
+		"""Get the key of the file at path."""
+		stat = os.stat(path)
+		return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+	def get(self, key):
+		"""Get the information for the key, None if there is none."""
+		with self.lock:
+			return self.map.get(key)
+
+	def set(self, key, val):
+		"""Set the information for the key."""
+		with self.lock:
+			self.map[key] = val
+
+	def load(self, dir):
+		"""Load the information stored in the cache directory dir."""
+		with self.lock:
+			if dir in self.loaded:
+				return
+			self.loaded.add(dir)
+			try:
+				with open(os.path.join(dir, self.name)) as file:
+					self.map.update(json.load(file))
+			except (OSError, ValueError):
+				pass
+
+	def save(self, dir):
+		"""Save the information in the cache directory dir."""
+		path = os.path.join(dir, self.name)
+		tmp = f"{path}.{threading.get_ident()}.tmp"
+		with self.lock:
+			with open(tmp, "w") as file:
+				json.dump(self.map, file)
+		os.replace(tmp, path)
+
+
+DIGESTS = Store("digests.json")
+"""Digests of the content of the files."""
+
+INFOS = Store("infos.json")
+"""Image information: [width, height, EXIF orientation]."""
+
+
+def load_cache(album):
+	"""Load the persistent information of the cache of the album."""
+	dir = album.get_work_dir("cache")
+	DIGESTS.load(dir)
+	INFOS.load(dir)
+
+
+def save_cache(album):
+	"""Save the persistent information of the cache of the album."""
+	dir = album.get_work_dir("cache")
+	DIGESTS.save(dir)
+	INFOS.save(dir)
+
+
+def digest(path):
+	"""Compute the digest of the content of the file at path. The digest
+	is memoized as long as the modification time and the size of the
+	file does not change."""
+	key = DIGESTS.get_key(path)
+	res = DIGESTS.get(key)
+	if res is None:
+		h = hashlib.sha1()
+		with open(path, "rb") as file:
+			for block in iter(lambda: file.read(1 << 16), b""):
+				h.update(block)
+		res = h.hexdigest()
+		DIGESTS.set(key, res)
+	return res
+
+
+def get_errors():
+	"""Get the exceptions raised when an image cannot be read, converted
+	or built."""
+	import PIL.Image
+	from PIL import ImageCms
+	return (OSError, ValueError, PIL.Image.DecompressionBombError, ImageCms.PyCMSError)
+
+
+def get_info(path):
+	"""Get the information of the image at path as (width, height,
+	orientation) where orientation is the EXIF orientation (1 for
+	no transformation) and width x height the size of the image once
+	oriented. The information is memoized as long as the file does not
+	change. Raise OSError if the image cannot be read."""
+	key = INFOS.get_key(path)
+	res = INFOS.get(key)
+	if res is None:
+		with open_image(path) as image:
+			res = read_info(image, image.getexif())
+		INFOS.set(key, res)
+	return tuple(res)
+
+
+def read_info(image, exif):
+	"""Build the information, as returned by get_info(), of an opened image
+	and of its EXIF data."""
+	w, h = image.size
+	orientation = exif.get(0x0112, 1)
+	if orientation not in JPEGTRAN_OPTIONS:
+		orientation = 1
+	if orientation >= 5:
+		w, h = h, w
+	return [w, h, orientation]
+
+
+def get_format(path):
+	"""Get the actual format of an image from its first bytes. Return None
+	if the format is unknown."""
+	with open(path, "rb") as file:
+		head = file.read(32)
+	if head.startswith(b"\xff\xd8\xff"):
+		return "jpeg"
+	elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+		return "png"
+	elif head.startswith(b"%PDF"):
+		return "pdf"
+	elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+		return "webp"
+	elif head[:4] in (b"II*\x00", b"MM\x00*"):
+		return "tiff"
+	elif head[:6] in (b"GIF87a", b"GIF89a"):
+		return "gif"
+	elif head[:2] == b"BM":
+		return "bmp"
+	elif head[4:8] == b"ftyp":
+		brand = head[8:12]
+		if brand in (b"avif", b"avis"):
+			return "avif"
+		elif brand in (b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"):
+			return "heic"
+	return None
+
+
+def open_image(path):
+	"""Open an image with PIL. HEIF/HEIC images are supported if the
+	optional package pillow_heif is installed."""
+	global OPENERS_REGISTERED
+	import PIL.Image
+	if not OPENERS_REGISTERED:
+		with OPENER_LOCK:
+			if not OPENERS_REGISTERED:
+				OPENERS_REGISTERED = True
+				try:
+					import pillow_heif
+					pillow_heif.register_heif_opener()
+				except ImportError:
+					pass
+	return PIL.Image.open(path)
+
+
+def load_image(path):
+	"""Load the image at path, with its EXIF orientation applied."""
+	import PIL.ImageOps
+	with open_image(path) as image:
+		image.load()
+		res = PIL.ImageOps.exif_transpose(image)
+	if res is None:
+		res = image
+	return res
+
+
+def to_pixels(length, dpi):
+	"""Convert a length in mm to a number of pixels at the given DPI."""
+	return max(1, round(length * dpi / 25.4))
+
+
+def has_alpha(image):
+	"""Test if the PIL image has transparency."""
+	return image.mode in ("RGBA", "LA", "PA") \
+		or (image.mode == "P" and "transparency" in image.info)
+
+
+ICC_MODES = {}
+ICC_LOCK = threading.Lock()
+
+def get_icc_mode(icc):
+	"""Get the PIL mode (RGB, CMYK or L) of the colors described by the
+	ICC profile icc (as bytes), None if the profile cannot be read or
+	uses another color space."""
+	key = hashlib.sha1(icc).digest()
+	with ICC_LOCK:
+		try:
+			return ICC_MODES[key]
+		except KeyError:
+			pass
+	from PIL import ImageCms
+	try:
+		space = ImageCms.ImageCmsProfile(BytesIO(icc)).profile.xcolor_space.strip()
+		mode = {"RGB": "RGB", "CMYK": "CMYK", "GRAY": "L"}.get(space)
+	except (OSError, ImageCms.PyCMSError):
+		mode = None
+	with ICC_LOCK:
+		ICC_MODES[key] = mode
+	return mode
+
+
+def set_icc(image, icc):
+	"""Embed the ICC profile icc (as bytes or None) in the PIL image if
+	it describes the colors of the image mode."""
+	if icc is not None and get_icc_mode(icc) == image.mode.rstrip("A"):
+		image.info["icc_profile"] = icc
+	else:
+		image.info.pop("icc_profile", None)
+
+
+def to_rgb(image):
+	"""Convert the PIL image, without transparency, to RGB. If the image
+	embeds an ICC profile of its mode (typically CMYK), the colors are
+	converted by this profile to sRGB."""
+	icc = image.info.get("icc_profile")
+	if icc is not None and image.mode != "RGB" and get_icc_mode(icc) == image.mode:
+		from PIL import ImageCms
+		image = ImageCms.profileToProfile(image,
+			ImageCms.ImageCmsProfile(BytesIO(icc)),
+			ImageCms.createProfile("sRGB"),
+			renderingIntent = ImageCms.Intent.PERCEPTUAL,
+			outputMode = "RGB")
+		icc = None
+	else:
+		image = image.convert("RGB")
+	set_icc(image, icc)
+	return image
+
+
+def get_ext(path):
+	"""Get the extension of a derived image of the image at path: JPEG
+	images gives JPEG images, other images gives PNG to keep transparency."""
+	if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+		return ".jpg"
+	else:
+		return ".png"
+
+
+def save(image, path, dpi, icc = None):
+	"""Save the image at path with the given DPI and ICC profile (as bytes).
+	The format is deduced from the extension of the path."""
+	options = {"dpi": (dpi, dpi)}
+	if icc is None:
+		icc = image.info.get("icc_profile")
+	if icc is not None:
+		options["icc_profile"] = icc
+	if path.endswith(".jpg"):
+		if image.mode not in ("RGB", "L", "CMYK"):
+			image = image.convert("RGB")
+		image.save(path, "JPEG", quality=92, **options)
+	else:
+		image.save(path, "PNG", **options)
+
+
+class Profile:
+	"""ICC output profile the images are converted to. Transforms are
+	built once for each input profile and mode, and shared by all images
+	and threads."""
+
+	def __init__(self, path):
+		from PIL import ImageCms
+		self.path = path
+		self.digest = digest(path)
+		with open(path, "rb") as file:
+			self.data = file.read()
+		self.profile = ImageCms.ImageCmsProfile(path)
+		space = self.profile.profile.xcolor_space.strip()
+		self.mode = "CMYK" if space == "CMYK" else "RGB"
+		self.srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+		self.transforms = {}
+		self.lock = threading.Lock()
+		self.colors = {}
+
+	def is_cmyk(self):
+		"""Test if the profile produces CMYK images."""
+		return self.mode == "CMYK"
+
+	def get_transform(self, mode, icc = None):
+		"""Get the transform for images of the given mode (RGB, RGBA or,
+		with an embedded profile, CMYK or L) with the given embedded ICC
+		profile (as bytes, None for sRGB)."""
+		from PIL import ImageCms
+		key = (mode, None if icc is None else hashlib.sha1(icc).digest())
+		with self.lock:
+			try:
+				return self.transforms[key]
+			except KeyError:
+				pass
+		if icc is None:
+			source = self.srgb
+		else:
+			source = ImageCms.ImageCmsProfile(BytesIO(icc))
+		out_mode = self.mode + "A" if mode == "RGBA" else self.mode
+		transform = ImageCms.buildTransform(source, self.profile, mode, out_mode,
+			renderingIntent = ImageCms.Intent.PERCEPTUAL)
+		with self.lock:
+			self.transforms[key] = transform
+		return transform
+
+	def apply(self, image):
+		"""Convert the image to the profile. For CMYK profiles, images with
+		transparency are kept as is as CMYK images cannot be transparent
+		in PNG. Images embedding a CMYK or grayscale profile are converted
+		from their own mode."""
+		from PIL import ImageCms
+		alpha = has_alpha(image)
+		if alpha and self.is_cmyk():
+			return image
+		mode = "RGBA" if alpha else "RGB"
+		icc = image.info.get("icc_profile")
+		if icc is not None:
+			native = get_icc_mode(icc)
+			if not alpha and native in ("CMYK", "L") and image.mode == native:
+				mode = native
+			elif native != "RGB":
+				icc = None
+		if image.mode != mode:
+			image = image.convert(mode)
+		return ImageCms.applyTransform(image, self.get_transform(mode, icc))
+
+	def convert_color(self, color):
+		"""Convert a color "#RRGGBB" to a tuple of components in [0, 1]
+		in the color space of the profile."""
+		try:
+			return self.colors[color]
+		except KeyError:
+			import PIL.Image
+			rgb = tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
+			image = self.apply(PIL.Image.new("RGB", (1, 1), rgb))
+			res = tuple(c / 255. for c in image.getpixel((0, 0)))
+			self.colors[color] = res
+			return res
+
+
+PROFILES = {}
+PROFILE_LOCK = threading.Lock()
+
+def get_profile(path):
+	"""Get the output profile for the ICC file at path. Profiles are
+	shared by all drawers so that their transforms are built once.
+	Raise graph.GenError if the profile cannot be read."""
+	with PROFILE_LOCK:
+		try:
+			return PROFILES[path]
+		except KeyError:
+			from PIL import ImageCms
+			try:
+				profile = Profile(path)
+			except (OSError, ImageCms.PyCMSError) as e:
+				raise graph.GenError(f"cannot read output profile {path}: {e}")
+			PROFILES[path] = profile
+			return profile
+
+
+class Factory:
+	"""Factory building derived images for an album. If an output profile
+	is given, all built images are converted to this profile."""
+
+	def __init__(self, album, mon = io.DEF, jobs = None, profile = None):
+		self.album = album
+		self.mon = mon
+		self.jobs = jobs
+		self.profile = profile
+		self.dir = None
+		self.pool = None
+		self.futures = {}
+		self.conversions = {}
+		self.exts = {}
+
+	def get_dir(self):
+		"""Get the cache directory."""
+		if self.dir is None:
+			self.dir = self.album.get_work_dir("cache")
+			DIGESTS.load(self.dir)
+			INFOS.load(self.dir)
+		return self.dir
+
+	def get_info(self, path):
+		"""Get the information of the image at path (see get_info()).
+		Raise graph.GenError if the image cannot be read."""
+		self.get_dir()
+		try:
+			return get_info(path)
+		except get_errors() as e:
+			raise graph.GenError(f"cannot read image {path}: {e}")
+
+	def has_alpha(self, path):
+		"""Test if the image at path has transparency. Raise
+		graph.GenError if the image cannot be read."""
+		try:
+			with open_image(path) as image:
+				return has_alpha(image)
+		except get_errors() as e:
+			raise graph.GenError(f"cannot read image {path}: {e}")
+
+	def get_path(self, kind, key, ext):
+		"""Get the path of the derived image of the given kind, with the
+		given key (a tuple) and extension."""
+		key = (VERSION, kind) + tuple(key)
+		if self.profile is not None:
+			key = key + (self.profile.digest,)
+		h = hashlib.sha1(repr(key).encode("utf-8"))
+		return os.path.join(self.get_dir(), f"{kind}-{h.hexdigest()[:24]}{ext}")
+
+	def get_ext(self, path):
+		"""Get the extension of a derived image of the image at path."""
+		try:
+			return self.exts[path]
+		except KeyError:
+			pass
+		if self.profile is not None and self.profile.is_cmyk():
+			ext = ".png" if self.has_alpha(path) else ".jpg"
+		else:
+			ext = get_ext(path)
+		self.exts[path] = ext
+		return ext
+
+	def make(self, kind, key, ext, fun, *args):
+		"""Get the derived image of the given kind, key and extension.
+		If it does not exist, it is built by calling fun(*args) in the
+		thread pool, that returns a PIL image and its DPI. Return the
+		path of the image."""
+		return self.submit(kind, key, ext, False, fun, args)
+
+	def make_file(self, kind, key, ext, fun, *args):
+		"""Same as make() but fun(path, *args) writes itself the image
+		in path."""
+		return self.submit(kind, key, ext, True, fun, args)
+
+	def submit(self, kind, key, ext, direct, fun, args):
+		path = self.get_path(kind, key, ext)
+		if path in self.futures or os.path.exists(path):
+			return path
+		if self.pool is None:
+			self.pool = ThreadPoolExecutor(max_workers=self.jobs)
+		self.futures[path] = self.pool.submit(self.build, path, direct, fun, args)
+		return path
+
+	def build(self, path, direct, fun, args):
+		"""Build the image at path in a temporary file and move it to path
+		when it is complete so that an interrupted build is not cached."""
+		root, ext = os.path.splitext(path)
+		tmp = f"{root}-{threading.get_ident()}.tmp{ext}"
+		try:
+			if direct:
+				fun(tmp, *args)
+			else:
+				image, dpi = fun(*args)
+				icc = None
+				if self.profile is not None:
+					image = self.profile.apply(image)
+					if image.mode.startswith(self.profile.mode):
+						icc = self.profile.data
+				save(image, tmp, dpi, icc)
+			os.replace(tmp, path)
+		finally:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+
+	def wait(self):
+		"""Wait for the images to be built.
+		Raise graph.GenError if an image cannot be built."""
+		if self.dir is not None:
+			DIGESTS.save(self.dir)
+			INFOS.save(self.dir)
+		if self.pool is None:
+			return
+		errors = get_errors()
+		try:
+			for (path, future) in self.futures.items():
+				try:
+					future.result()
+				except errors as e:
+					raise graph.GenError(f"cannot build {path}: {e}")
+		finally:
+			self.pool.shutdown()
+			self.pool = None
+			self.futures = {}
+
+	def tile(self, path, width, height, dpi):
+		"""Get an image of width x height mm covered with the image at path
+		repeated at its natural size."""
+		return self.make("tile",
+			(digest(path), width, height, dpi),
+			self.get_ext(path),
+			render_tile, path, width, height, dpi)
+
+	def convert(self, path):
+		"""Get a version of the image at path readable by pdflatex. If the
+		image is not JPEG, PNG or PDF (as found from its content), it is
+		converted to PNG if it has transparency or to JPEG otherwise.
+		If there is an output profile or if the image has an EXIF
+		orientation, JPEG and PNG images are also converted."""
+		try:
+			return self.conversions[path]
+		except KeyError:
+			pass
+		if path in self.futures or os.path.dirname(path) == self.dir:
+			return path
+		format = get_format(path)
+		if format is None or format == "pdf":
+			res = path
+		elif format in SUPPORTED_FORMATS and self.profile is None \
+		and self.get_info(path)[2] == 1:
+			res = path
+		elif format == "jpeg" and self.profile is None and JPEGTRAN is not None:
+			res = self.make_file("orient", (digest(path),), ".jpg",
+				render_jpegtran, path, self.get_info(path)[2])
+		else:
+			if format in LOSSLESS_FORMATS and self.profile is None:
+				ext = ".png"
+			else:
+				if self.has_alpha(path):
+					ext = ".png"
+				elif self.profile is not None and self.profile.is_cmyk():
+					ext = ".jpg"
+				elif format in LOSSLESS_FORMATS or format == "png":
+					ext = ".png"
+				else:
+					ext = ".jpg"
+			res = self.make("convert", (digest(path),), ext, render_convert, path)
+		self.conversions[path] = res
+		return res
+
+	def crop(self, path, box, width, height, dpi, filters = ()):
+		"""Get the part of the image at path in box, a tuple (left, top,
+		right, bottom) in pixels, to be displayed in width x height mm,
+		with the given filters applied."""
+		return self.make("crop",
+			(digest(path), box, round(width, 2), round(height, 2), dpi)
+				+ ((filters,) if filters else ()),
+			self.get_ext(path),
+			render_crop, path, box, width, height, dpi, filters)
+
+	def resize(self, path, width, height, dpi, filters = ()):
+		"""Get the image at path resized to be displayed in width x height
+		mm, with the given filters applied. Vector images (PDF) are
+		returned as is."""
+		format = get_format(path)
+		if format is None or format == "pdf":
+			return path
+		width, height = round(width, 2), round(height, 2)
+		return self.make("resize",
+			(digest(path), width, height, dpi, filters),
+			self.get_ext(path),
+			render_resize, path, width, height, dpi, filters)
+
+	def shadow(self, width, height, radius, color, opacity, dpi):
+		"""Get the image of a fuzzy shadow (see render_shadow())."""
+		width, height = round(width, 2), round(height, 2)
+		return self.make("shadow",
+			(width, height, radius, color, opacity, dpi), ".png",
+			render_shadow, width, height, radius, color, opacity, dpi)
+
+
+def get_shadow_pad(radius):
+	"""Get the padding (in mm) around the shadow image of a frame for a
+	shadow of the given blur radius."""
+	return 2 * radius
+
+
+def render_shadow(width, height, radius, color, opacity, dpi):
+	"""Render the fuzzy shadow of a frame of width x height mm, for a
+	blur radius in mm, a color as "#RRGGBB" and an opacity in [0, 1].
+	The image is padded by get_shadow_pad(radius) on each side."""
+	import PIL.Image, PIL.ImageDraw, PIL.ImageFilter
+	pad = to_pixels(get_shadow_pad(radius), dpi)
+	w, h = to_pixels(width, dpi), to_pixels(height, dpi)
+	r = radius * dpi / 25.4
+	mask = PIL.Image.new("L", (w + 2 * pad, h + 2 * pad), 0)
+	PIL.ImageDraw.Draw(mask).rounded_rectangle(
+		(pad, pad, pad + w - 1, pad + h - 1),
+		radius = round(r), fill = round(255 * opacity))
+	if r > 0:
+		mask = mask.filter(PIL.ImageFilter.GaussianBlur(r / 2))
+	rgb = tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
+	image = PIL.Image.new("RGB", mask.size, rgb)
+	image.putalpha(mask)
+	return image, dpi
+
+
+def filter_unsharp(image, percent, dpi):
+	"""Sharpen the image for print with an unsharp mask."""
+	import PIL.ImageFilter
+	if percent is None:
+		percent = 80
+	return image.filter(PIL.ImageFilter.UnsharpMask(
+		radius = dpi / 300., percent = round(percent), threshold = 2))
+
+def filter_grayscale(image, arg, dpi):
+	"""Convert the image to grayscale."""
+	return image.convert("L")
+
+SEPIA_MATRIX = (
+	.393, .769, .189, 0,
+	.349, .686, .168, 0,
+	.272, .534, .131, 0
+)
+
+def filter_sepia(image, arg, dpi):
+	"""Give a sepia tone to the image."""
+	return image.convert("RGB").convert("RGB", SEPIA_MATRIX)
+
+def filter_contrast(image, factor, dpi):
+	"""Change the contrast of the image (default factor 1.2)."""
+	import PIL.ImageEnhance
+	if factor is None:
+		factor = 1.2
+	return PIL.ImageEnhance.Contrast(image).enhance(factor)
+
+FILTERS = {
+	"unsharp": filter_unsharp,
+	"grayscale": filter_grayscale,
+	"sepia": filter_sepia,
+	"contrast": filter_contrast
+}
+"""Filters applicable to the images, called with (image, argument, DPI)."""
+
+
+def apply_filters(image, filters, dpi):
+	"""Apply the chain of filters, a tuple of (name, argument), to the
+	image. The transparency of the image is kept."""
+	if not filters:
+		return image
+	alpha = None
+	if has_alpha(image):
+		image = image.convert("RGBA")
+		alpha = image.getchannel("A")
+	if image.mode not in ("RGB", "L"):
+		image = image.convert("RGB")
+	for (name, arg) in filters:
+		image = FILTERS[name](image, arg, dpi)
+	if alpha is not None:
+		image = image.convert("RGBA" if image.mode == "RGB" else "LA")
+		image.putalpha(alpha)
+	return image
+
+
+def render_resize(path, width, height, dpi, filters):
+	"""Render the image at path resized to width x height mm at the given
+	DPI (but never enlarged) with the given filters applied."""
+	import PIL.Image
+	image = load_image(path)
+	w, h = to_pixels(width, dpi), to_pixels(height, dpi)
+	k = min(1., max(image.width / w, image.height / h))
+	size = (max(1, round(w * k)), max(1, round(h * k)))
+	if size != image.size:
+		image = image.resize(size, PIL.Image.LANCZOS)
+	if not has_alpha(image) and image.mode not in ("RGB", "L"):
+		image = to_rgb(image)
+	icc = image.info.get("icc_profile")
+	image = apply_filters(image, filters, dpi)
+	set_icc(image, icc)
+	return image, dpi
+
+
+def render_jpegtran(out, path, orientation):
+	"""Write in out the JPEG image at path with the given EXIF orientation
+	applied losslessly with jpegtran. Use PIL if jpegtran fails, for instance
+	because the image size is not a multiple of the JPEG block size."""
+	rc = subprocess.run(
+		[JPEGTRAN, "-perfect", "-copy", "icc"]
+		+ JPEGTRAN_OPTIONS[orientation]
+		+ ["-outfile", out, path],
+		stdin = subprocess.DEVNULL,
+		stdout = subprocess.DEVNULL,
+		stderr = subprocess.DEVNULL)
+	if rc.returncode != 0:
+		image, dpi = render_convert(path)
+		save(image, out, dpi)
+
+
+def render_convert(path):
+	"""Read the image at path for conversion."""
+	image = load_image(path)
+	dpi = image.info.get("dpi", (72, 72))[0]
+	if not has_alpha(image) and image.mode not in ("RGB", "L"):
+		image = to_rgb(image)
+	return image, dpi
+
+
+def render_crop(path, box, width, height, dpi, filters = ()):
+	"""Render the part box of the image at path, to be displayed
+	in width x height mm. The part is reduced to the given DPI if it
+	has a bigger resolution but it is never enlarged. The filters are
+	applied to the reduced part."""
+	import PIL.Image
+	image = load_image(path)
+	image = image.crop(box)
+	w, h = to_pixels(width, dpi), to_pixels(height, dpi)
+	if w < image.width and h < image.height:
+		image = image.resize((w, h), PIL.Image.LANCZOS)
+	if not has_alpha(image) and image.mode not in ("RGB", "L"):
+		image = to_rgb(image)
+	icc = image.info.get("icc_profile")
+	image = apply_filters(image, filters, dpi)
+	set_icc(image, icc)
+	return image, dpi
+
+
+def render_tile(path, width, height, dpi):
+	"""Render an image of width x height mm at the given DPI covered by
+	the image at path. As for LaTeX, the natural size of the image is
+	given by its DPI, or 72 DPI if it has no DPI."""
+	import PIL.Image
+	tile = load_image(path)
+	tdpi = tile.info.get("dpi", (72, 72))
+	tw = max(1, round(tile.width * dpi / float(tdpi[0] or 72)))
+	th = max(1, round(tile.height * dpi / float(tdpi[1] or 72)))
+	alpha = has_alpha(tile)
+	if alpha:
+		tile = tile.convert("RGBA")
+	elif tile.mode != "RGB":
+		tile = to_rgb(tile)
+	icc = tile.info.get("icc_profile")
+	if (tw, th) != tile.size:
+		tile = tile.resize((tw, th), PIL.Image.LANCZOS)
+	W, H = to_pixels(width, dpi), to_pixels(height, dpi)
+	image = PIL.Image.new(tile.mode, (W, H))
+	for y in range(0, H, th):
+		for x in range(0, W, tw):
+			image.paste(tile, (x, y))
+	set_icc(image, icc)
+	return image, dpi
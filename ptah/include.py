@@ -0,0 +1,151 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Reading of album files and of the files they include.
+
+The pages, styles and colors of an album may be split in several files
+included with an entry "include: FILE", FILE being relative to the
+including file. As parsing YAML is slow, the content of each file is
+cached as JSON in the "cache" working directory of the album, keyed by
+the path and the hash of the file: only the modified files are parsed
+again and the cached content of their previous versions is removed."""
+
+import glob
+import hashlib
+import json
+import os
+import os.path
+import threading
+
+import yaml
+
+from ptah.util import CheckError
+
+KEY = "include"
+"""Key of the include entries."""
+
+VERSION = 2
+"""Version of the cache: changing it invalidates the cached files."""
+
+
+def is_include(item):
+	"""Test if an item of a list of pages or styles is an include."""
+	return isinstance(item, dict) and KEY in item
+
+
+def resolve(item, source, album, stack = ()):
+	"""Get the path of the file included by item in the file source (None
+	for the album file), stack being the paths of the files being included
+	(source being the last one). Raise CheckError if the file does not
+	exist or if it is already being included."""
+	path = str(item[KEY])
+	if source is None:
+		base = album.get_base()
+	else:
+		base = os.path.dirname(source)
+	path = os.path.normpath(os.path.join(base, path))
+	if not os.path.isfile(path):
+		raise CheckError(f"cannot include {item[KEY]} in {source or album.get_location()}!")
+	chain = (album.path,) + tuple(stack)
+	if any(os.path.abspath(path) == os.path.abspath(x) for x in chain):
+		raise CheckError(f"include cycle: {' -> '.join(chain + (path,))}!")
+	return path
+
+
+def get_cache(album, path, data):
+	"""Get the path of the cached content of the file at path with the
+	given data, None if there is no cache directory. The name of the cache
+	is made of a prefix depending on the path followed by the hash of the
+	data."""
+	prefix = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+	h = hashlib.sha1(data)
+	h.update(f"{VERSION}:{yaml.__version__}".encode("utf-8"))
+	try:
+		return os.path.join(album.get_work_dir("cache"), f"yaml-{prefix}-{h.hexdigest()[:24]}.json")
+	except OSError:
+		return None
+
+
+def save_cache(cache, content):
+	"""Save the content in the cache file and remove the caches of the
+	previous versions of the same file. The content is not saved if it
+	cannot be represented exactly in JSON (dates, non-string keys, etc)."""
+	try:
+		text = json.dumps(content)
+		if json.loads(text) != content:
+			return
+	except (TypeError, ValueError):
+		return
+	tmp = f"{cache}.{os.getpid()}.{threading.get_ident()}.tmp"
+	try:
+		with open(tmp, "w", encoding="utf-8") as file:
+			file.write(text)
+		os.replace(tmp, cache)
+	except OSError:
+		return
+	prefix = os.path.basename(cache).rsplit("-", 1)[0]
+	for old in glob.glob(os.path.join(os.path.dirname(cache), f"{prefix}-*.json")):
+		if old != cache:
+			try:
+				os.remove(old)
+			except OSError:
+				pass
+
+
+def load(path, album):
+	"""Load the content of the YAML file at path, from the cache if the
+	file has already been parsed. Raise CheckError if the file cannot be
+	read or parsed."""
+	try:
+		with open(path, "rb") as file:
+			data = file.read()
+	except OSError:
+		raise CheckError(f"cannot open {path}!")
+
+	# look in the cache
+	cache = get_cache(album, path, data)
+	if cache is not None:
+		try:
+			with open(cache, encoding="utf-8") as file:
+				return json.load(file)
+		except (OSError, ValueError):
+			pass
+
+	# parse the file
+	try:
+		content = yaml.safe_load(data)
+	except yaml.YAMLError as e:
+		raise CheckError(f"{path}: {e}")
+
+	# save in the cache
+	if cache is not None:
+		save_cache(cache, content)
+	return content
+
+
+def load_list(item, source, album, stack = ()):
+	"""Load the list included by item in the file source, stack being the
+	paths of the files being included (see resolve()). Return the path of
+	the included file and its list."""
+	path = resolve(item, source, album, stack)
+	content = load(path, album)
+	if content is None:
+		content = []
+	if isinstance(content, str) or not isinstance(content, list):
+		raise CheckError(f"{path} must contain a list!")
+	return path, content
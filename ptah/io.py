@@ -15,7 +15,12 @@
 #	along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """Input/output management module for Maat tool."""
+import atexit
+import json
+import re
 import sys
+import threading
+import time
 
 # ANSI coloration
 NORMAL = "\033[0m"
@@ -72,97 +77,202 @@ BACK_WHITE = "\033[47m"
 
 #null_stream = NullStream()
 
+BUFFER_LINES = 64
+"""Number of buffered lines causing the monitor output to be flushed."""
+FLUSH_DELAY = .2
+"""Maximal time (in s) a buffered line waits before being output."""
+WRITE_SIZE = 1024
+"""Maximal number of characters of buffered lines written at once: such
+writes are atomic on pipes (PIPE_BUF) so that the lines of concurrent
+ptah processes are not mixed."""
+
+ANSI_RE = re.compile("\033\\[[0-9;]*m")
+
+
 class Monitor:
-	"""A context is used to configure the execution of an action."""
+	"""A context is used to configure the execution of an action.
+
+	Messages are output on the standard error, buffered and batched, and
+	can be called from any thread. Buffered messages are output at most
+	FLUSH_DELAY later, and before running external commands. Lines are
+	written whole so that the output of several processes are only mixed
+	line by line, each process counting its own repetitions. Identical
+	warnings and errors are only displayed once, the number of repetitions
+	being displayed when the monitor is closed. If json is set, messages
+	are output as JSON lines {"level": LEVEL, "message": MESSAGE, "time":
+	TIMESTAMP} (plus "count" for repeated messages and "result" for the
+	end of actions of level "action")."""
 	out = sys.stdout
 	err = sys.stderr
 	quiet = False
 	verbose = False
 	flushed = False
 	action = None
+	json = False
+	command_ena = True
+
+	def __init__(self):
+		self.lock = threading.RLock()
+		self.buffer = []
+		self.counts = {}
+		self.timer = None
+		atexit.register(self.close)
 
 	def handle_action(self):
 		"""Manage a pending action display."""
-		if self.action and not self.flushed:
+		if self.action and not self.flushed and not self.json:
 			sys.stderr.write("\n")
 			self.flushed = True
 
+	def flush(self):
+		"""Output the buffered messages."""
+		with self.lock:
+			if self.timer is not None:
+				self.timer.cancel()
+				self.timer = None
+			if self.buffer:
+				self.handle_action()
+				chunk = ""
+				for line in self.buffer:
+					if chunk and len(chunk) + len(line) > WRITE_SIZE:
+						sys.stderr.write(chunk)
+						sys.stderr.flush()
+						chunk = ""
+					chunk += line
+				sys.stderr.write(chunk)
+				self.buffer = []
+			sys.stderr.flush()
+
+	def close(self):
+		"""Display the number of repetitions of repeated messages and
+		flush the output."""
+		with self.lock:
+			for ((level, msg), count) in self.counts.items():
+				if count > 1:
+					self.buffer.append(self.format(level, msg, count))
+			self.counts = {}
+			self.flush()
+
+	def format(self, level, msg, count = 1, result = None):
+		"""Format a message line. result is the result of an ending
+		action (only used in JSON)."""
+		if self.json:
+			desc = {"level": level, "message": str(msg), "time": time.time()}
+			if count > 1:
+				desc["count"] = count
+			if result is not None:
+				desc["result"] = ANSI_RE.sub("", result)
+			return json.dumps(desc) + "\n"
+		if count > 1:
+			msg = f"{msg} ({count} times)"
+		if level == "error":
+			return f"{BOLD}{RED}ERROR: {NORMAL}{msg}\n"
+		elif level == "warning":
+			return f"{BOLD}{YELLOW}WARNING:{NORMAL} {msg}\n"
+		elif level == "info":
+			return BOLD + BLUE + str(msg) + NORMAL + "\n"
+		elif level == "success":
+			return BOLD + GREEN + "[100%] " + str(msg) + NORMAL + "\n"
+		elif level == "command":
+			return CYAN + "> " + str(msg) + NORMAL + "\n"
+		else:
+			return str(msg) + "\n"
+
+	def write(self, level, msg, urgent = True):
+		"""Output a message of the given level. Warnings and errors already
+		output are only counted. If urgent is false, the message may stay
+		in the buffer for a while."""
+		if self.quiet:
+			return
+		with self.lock:
+			if level in ("warning", "error"):
+				key = (level, str(msg))
+				count = self.counts.get(key, 0)
+				self.counts[key] = count + 1
+				if count:
+					return
+			self.buffer.append(self.format(level, msg))
+			if urgent or len(self.buffer) >= BUFFER_LINES:
+				self.flush()
+			elif self.timer is None:
+				self.timer = threading.Timer(FLUSH_DELAY, self.flush)
+				self.timer.daemon = True
+				self.timer.start()
+
 	def print_command(self, cmd):
 		"""Print a command before running it."""
-		if not self.quiet and self.command_ena:
-			self.handle_action()
-			sys.stderr.write(CYAN + "> " + str(cmd) + NORMAL + "\n")
-			sys.stderr.flush()
+		if self.command_ena:
+			self.write("command", cmd)
 
 	def print_info(self, info):
 		"""Print information line about built target."""
-		if not self.quiet:
-			self.handle_action()
-			sys.stderr.write(BOLD + BLUE + str(info) + NORMAL + "\n")
-			sys.stderr.flush()
+		self.write("info", info)
 
 	def print_error(self, msg):
 		"""Print an error message."""
-		if not self.quiet:
-			self.handle_action()
-			sys.stderr.write(f"{BOLD}{RED}ERROR: {NORMAL}{msg}\n")
-			sys.stderr.flush()
+		self.write("error", msg)
 
 	def print_fatal(self, msg):
 		"""Print an error message."""
 		if not self.quiet:
-			sys.stderr.write(BOLD + RED + "ERROR: " + str(msg) + NORMAL + "\n")
+			self.write("error", msg)
 			sys.exit(1)
 
 	def print_warning(self, msg):
 		"""Print a warning message."""
-		if not self.quiet:
-			self.handle_action()
-			sys.stderr.write(f"{BOLD}{YELLOW}WARNING:{NORMAL} {msg}\n")
-			sys.stderr.flush()
+		self.write("warning", msg, urgent=False)
 
 	def print_success(self, msg):
 		"""Print a success message."""
-		if not self.quiet:
-			self.handle_action()
-			sys.stderr.write(BOLD + GREEN + "[100%] " + msg + str(NORMAL) + "\n")
-			sys.stderr.flush()
+		self.write("success", msg)
 
 	def print_action(self, msg):
 		"""Print a beginning action."""
 		if not self.quiet:
-			sys.stderr.write("%s ... " % msg)
-			sys.stderr.flush()
-			self.action = msg
-			self.flushed = False
+			with self.lock:
+				self.flush()
+				if self.json:
+					sys.stderr.write(self.format("action", msg))
+				else:
+					sys.stderr.write("%s ... " % msg)
+				sys.stderr.flush()
+				self.action = msg
+				self.flushed = False
 
 	def print_final(self, msg):
 		if not self.quiet:
-			if self.flushed:
-				sys.stderr.write("%s ... " % self.action)
-			sys.stderr.write(msg)
-			sys.stderr.write("\n");
-			sys.stderr.flush()
-			self.action = None
-			self.flushed = False
+			with self.lock:
+				self.flush()
+				if self.json:
+					sys.stderr.write(self.format("action", self.action or "", result=msg))
+				else:
+					if self.flushed:
+						sys.stderr.write("%s ... " % self.action)
+					sys.stderr.write(msg)
+					sys.stderr.write("\n");
+				sys.stderr.flush()
+				self.action = None
+				self.flushed = False
 
-	def print_success(self, msg = ""):
+	def print_action_success(self, msg = ""):
 		"""End an action with success."""
 		if msg:
 			msg = "(%s) " % msg
-		self.print_action_final(msg + GREEN + BOLD + "[OK]" + NORMAL)
+		self.print_final(msg + GREEN + BOLD + "[OK]" + NORMAL)
 
 	def print_failure(self, msg = ""):
 		"""End an action with failure."""
 		if msg:
 			msg = "(%s) " % msg
-		self.print_action_final(msg + RED + BOLD + "[FAILED]" + NORMAL)
+		self.print_final(msg + RED + BOLD + "[FAILED]" + NORMAL)
 
 	def print(self, msg):
-		if sys.stderr == sys.stdout:
-			self.handle_action()
-		sys.stdout.write(msg + "\n")
-		sys.stdout.flush()
+		with self.lock:
+			self.flush()
+			if sys.stderr == sys.stdout:
+				self.handle_action()
+			sys.stdout.write(msg + "\n")
+			sys.stdout.flush()
 
 
 DEF = Monitor()		# better to remove it at some point
@@ -1,9 +1,12 @@
 """Module providing draw for Latex output."""
 
+import bisect
+import hashlib
 import os
 import os.path
 import subprocess
 import sys
+import time
 
 import ptah
 from ptah import format
@@ -12,9 +15,8 @@ from ptah.album import Album, Image, Text, Page
 import ptah.font
 import ptah.format
 import ptah.props
-from ptah import graph, util
+from ptah import graph, images, io, layout, plugin, texlog, util
 import ptah.text
-import PIL.Image
 
 MINIATURE_WIDTH = 30
 MINIATURE_HEIGHT = 40
@@ -68,18 +70,46 @@ BORDER_STYLES = {
 }
 
 
+MAX_PASSES = 4
+AUX_EXTS = [".aux", ".toc", ".out"]
+
+PAGE_MARK = "% ptah-page: "
+FRAME_MARK = "% ptah-frame: "
+
 PROLOG = \
 """
 \\usepackage[utf8]{inputenc}
 """
 
+def get_length(length, ref = 0):
+	"""Get a length in mm from a number or a graph.Length relative to ref."""
+	if isinstance(length, graph.Length):
+		return length.get(ref)
+	else:
+		return length
+
+
 class Drawer(graph.Drawer):
 
-	def __init__(self, album = None):
+	def __init__(self, album = None, pages = None, root = None, mon = io.DEF):
 		graph.Drawer.__init__(self, album)
+		self.mon = mon
+		if pages is None:
+			pages = album.pages
+		self.pages = pages
+		if root is None:
+			root = os.path.splitext(album.path)[0]
+		self.root = root
 		self.dx = self.width / 2.
 		self.dy = self.height / 2.
 		self.colors = {}
+		self.sizes = {}
+		self.images = {}
+		self.image_boxes = {}
+		self.output_profile = None
+		if album.output_profile is not None:
+			self.output_profile = images.get_profile(album.output_profile)
+		self.factory = images.Factory(album, mon, profile=self.output_profile)
 		self.packages = [
 			"adjustbox",
 			"geometry",
@@ -108,52 +138,131 @@ class Drawer(graph.Drawer):
 		self.tmargin = album.format.top_margin
 
 		# text support
-		self.text_syntax = ptah.text.Syntax()
-		self.text_gen = None
+		self.text_cache = ptah.text.Cache(mon=mon)
 
 	# Drawer functions
 	def gen(self):
 		"""Generate the album.
 		Raises graph.GenError if there is an error."""
+		start = time.perf_counter()
 		self.gen_latex()
+		self.profile("LaTeX generation", start)
+		start = time.perf_counter()
+		self.factory.wait()
+		self.profile("image generation", start)
+		start = time.perf_counter()
 		self.gen_pdf()
-
-	def gen_pdf(self):
-		dir = self.album.get_base()
-
-		# move to parent directory
-		if dir != "":
-			cwd = os.path.abspath(os.getcwd())
-			os.chdir(dir)
-
-		# run pdflatex
-		base_path = os.path.basename(self.out_path)
+		self.profile("PDF generation", start)
+		self.profile(f"text cache: {self.text_cache.get_stats()}")
+
+	def profile(self, msg, start = None):
+		"""Display a profiling message, with the time since start if given."""
+		if util.PROFILE:
+			if start is not None:
+				msg = f"{msg}: {time.perf_counter() - start:.3f}s"
+			self.mon.print_info(f"{os.path.basename(self.root)}: {msg}")
+
+	def run_latex(self, *options):
+		"""Run pdflatex on the generated file with the given options.
+		Return the return code."""
+		base = self.album.get_base()
+		self.mon.flush()
 		rc = subprocess.run(
-			"pdflatex %s" % base_path,
-			shell=True,
+			["pdflatex", "-file-line-error",
+				"-output-directory=" + os.path.relpath(self.build_dir, base)]
+			+ list(options)
+			+ [os.path.relpath(self.out_path, base)],
+			cwd = base,
 			stdin = subprocess.DEVNULL,
 			stdout = sys.stdout if util.DEBUG else subprocess.DEVNULL,
 			stderr = sys.stderr if util.DEBUG else subprocess.DEVNULL)
-		if rc.returncode:
-			raise graph.GenError(f"generation error: {rc.returncode}")
-		if False:	#rc.returncode == 0:
-			rc = subprocess.run(
-				"pdflatex %s" % os.path.basename(self.out_path),
-				shell=True,
-				stdout = subprocess.DEVNULL,
-				stderr = subprocess.DEVNULL)
-
-		# cleanup
-		root = os.path.splitext(base_path)[0]
-		for ext in [".aux", ".log", ".out", ".tex", ".toc"]:
+		return rc.returncode
+
+	def get_build_path(self, ext):
+		"""Get the path of a file produced by pdflatex with the given
+		extension."""
+		root = os.path.splitext(os.path.basename(self.out_path))[0]
+		return os.path.join(self.build_dir, root + ext)
+
+	def hash_aux(self):
+		"""Compute the hash of auxiliary files used to resolve references."""
+		hashes = []
+		for ext in AUX_EXTS:
 			try:
-				os.remove(root + ext)
-			except (FileNotFoundError, OSError):
-				pass
+				with open(self.get_build_path(ext), "rb") as file:
+					hashes.append(hashlib.md5(file.read()).digest())
+			except OSError:
+				hashes.append(None)
+		return hashes
 
-		# back to the original directory
-		if dir != "":
-			os.chdir(cwd)
+	def gen_pdf(self):
+		"""Run pdflatex as many times as needed for the auxiliary files
+		to be stable (at most MAX_PASSES). Auxiliary files are kept in the
+		build directory so that an unchanged album needs only one pass."""
+		hashes = self.hash_aux()
+		for i in range(MAX_PASSES):
+			rc = self.run_latex("-interaction=nonstopmode", "-halt-on-error")
+			if rc:
+				errors = texlog.read(self.get_build_path(".log"))
+				if not errors:
+					raise graph.GenError(f"generation error: {rc}")
+				self.locate(errors)
+				raise graph.GenError(f"{errors[0]} (see {self.get_build_path('.log')})")
+			new_hashes = self.hash_aux()
+			if new_hashes == hashes:
+				break
+			hashes = new_hashes
+		os.replace(self.get_build_path(".pdf"), self.root + ".pdf")
+
+	def validate(self):
+		"""Generate the LaTeX and check it with pdflatex in draft mode, that
+		is, without reading images or writing PDF. Return the list of found
+		errors as texlog.TexError."""
+		self.gen_latex()
+		self.factory.wait()
+		rc = self.run_latex("-draftmode", "-interaction=nonstopmode")
+		errors = texlog.read(self.get_build_path(".log"))
+		if rc and not errors:
+			errors.append(texlog.TexError(f"pdflatex failed with code {rc}"))
+		self.locate(errors)
+		return errors
+
+	def locate(self, errors):
+		"""Find the page and the frame of the given TeX errors using the
+		markers of the generated file. Errors without file are considered
+		as in the generated file."""
+		try:
+			with open(self.out_path) as file:
+				lines = file.readlines()
+		except OSError:
+			return
+
+		# collect markers
+		marks = []
+		page, frame = None, None
+		for (num, line) in enumerate(lines):
+			if line.startswith(PAGE_MARK):
+				page = line[len(PAGE_MARK):].strip()
+				frame = None
+				marks.append((num + 1, page, frame))
+			elif line.startswith(FRAME_MARK):
+				frame = line[len(FRAME_MARK):].strip()
+				marks.append((num + 1, page, frame))
+		nums = [mark[0] for mark in marks]
+
+		# locate the errors
+		for error in errors:
+			if error.line is None:
+				continue
+			if error.file is not None \
+			and os.path.basename(error.file) != os.path.basename(self.out_path):
+				continue
+			i = bisect.bisect_right(nums, error.line)
+			if i > 0:
+				_, page, frame = marks[i - 1]
+				error.location = f"page {page}"
+				if frame is not None:
+					error.location += f", frame {frame}"
 
 	def gen_latex(self):
 		"""Called to generate the output file."""
@@ -164,12 +273,16 @@ class Drawer(graph.Drawer):
 			self.declare_color("#FFFFFF")
 		else:
 			self.declare_color(background_color)
-		for page in self.album.pages:
+		self.layout = layout.layout(self.album, self.pages)
+		for page in self.pages:
 			page.declare(self)
+		for (path, count) in self.images.items():
+			if count > 1:
+				self.image_boxes[path] = "\\PTAHimage" + util.alpha(len(self.image_boxes))
 
 		# generate the latex
-		root, ext = os.path.splitext(self.album.path)
-		self.out_path = root + ".tex"
+		self.build_dir = self.album.get_work_dir("build")
+		self.out_path = os.path.join(self.build_dir, os.path.basename(self.root) + ".tex")
 		self.out = open(self.out_path, "w")
 		write = self.out.write
 		self.gen_declaration()
@@ -181,11 +294,13 @@ class Drawer(graph.Drawer):
 	def gen_body(self):
 		write = self.out.write
 		first = True
-		for page in self.album.pages:
+		for page in self.pages:
 			if first:
 				first = False
 			else:
 				write("\\newpage\n")
+			self.set_side(page)
+			write(f"{PAGE_MARK}{page.name}:{page.number + 1}\n")
 
 			# background color
 			bg = page.background_color
@@ -223,8 +338,14 @@ class Drawer(graph.Drawer):
 					% (self.height/2, self.tmargin))
 			write("""\\end{tikzpicture}\n\n""")
 
-			# even/odd page management
-			self.lmargin, self.rmargin = self.rmargin, self.lmargin
+	def set_side(self, page):
+		"""Set the margins according to the parity of the page in the album."""
+		if page.number % 2 == 0:
+			self.lmargin = self.format.oddside_margin
+			self.rmargin = self.format.evenside_margin
+		else:
+			self.lmargin = self.format.evenside_margin
+			self.rmargin = self.format.oddside_margin
 
 	def gen_declaration(self):
 		write = self.out.write
@@ -245,9 +366,21 @@ class Drawer(graph.Drawer):
 		# write geometry
 		self.gen_geometry()
 
+		# write shared images
+		for (path, box) in self.image_boxes.items():
+			write("\\newsavebox{%s}\n" % box)
+			write("\\AtBeginDocument{\\sbox{%s}{\\includegraphics{%s}}}\n"
+				% (box, self.make_path(path)))
+
 		# write colors
 		for (col, name) in self.colors.items():
-			write("\\definecolor{%s}{HTML}{%s}\n" % (name, col[1:]))
+			if self.output_profile is None:
+				write("\\definecolor{%s}{HTML}{%s}\n" % (name, col[1:]))
+			else:
+				write("\\definecolor{%s}{%s}{%s}\n" % (
+					name,
+					"cmyk" if self.output_profile.is_cmyk() else "rgb",
+					",".join("%.4f" % c for c in self.output_profile.convert_color(col))))
 
 	def gen_geometry(self):
 		write = self.out.write
@@ -261,8 +394,114 @@ class Drawer(graph.Drawer):
 		write("}\n")
 
 	def get_size(self, path):
-		i = PIL.Image.open(path)
-		return i.size
+		try:
+			return self.sizes[path]
+		except KeyError:
+			w, h, _ = self.factory.get_info(path)
+			self.sizes[path] = (w, h)
+			return (w, h)
+
+	def find_size(self, path):
+		"""Get the size of the image at path, None if it cannot be read
+		(like PDF images)."""
+		try:
+			return self.get_size(path)
+		except graph.GenError:
+			return None
+
+	def declare_image(self, path, style = None):
+		if style is None or (style.mode != graph.Mode.FILL and not style.filter):
+			self.images[path] = self.images.get(path, 0) + 1
+		if style is not None and style.mode == graph.Mode.FIT \
+		and self.prerenders_shadow(style) and getattr(style, "box", None) is not None:
+			size = self.get_fit_size(path, style.box.w, style.box.h)
+			if size is not None:
+				shadow = self.get_shadow(size[0], size[1], style)
+				self.images[shadow] = self.images.get(shadow, 0) + 1
+
+	def get_fit_size(self, path, W, H):
+		"""Get the size of the image at path fitted in W x H mm, None if
+		the size of the image cannot be read."""
+		size = self.find_size(path)
+		if size is None:
+			return None
+		w, h = size
+		scale = min(W / w, H / h)
+		return (w * scale, h * scale)
+
+	def get_fill(self, path, W, H, align, scale, hshift = None, vshift = None, filters = ()):
+		"""Compute the part of the image at path visible in a frame of
+		W x H mm in fill mode, with the given filters applied. Return (cropped image path, x, y, w, h)
+		where (x, y) is the center of the visible part relative to the
+		center of the frame and w x h its size in mm. Return None if
+		no part of the image is visible."""
+		w, h = self.get_size(path)
+
+		# size and center of the scaled image
+		if w/h < W/H:
+			sw = W * scale
+			sh = h * sw / w
+		else:
+			sh = H * scale
+			sw = w * sh / h
+		_, dx, dy = ALIGN[align](W, H)
+		if hshift != None:
+			dx += hshift.get(sw)
+		if vshift != None:
+			dy -= vshift.get(sh)
+		_, adx, ady = ALIGN[align](sw, sh)
+		cx, cy = dx - adx, dy - ady
+
+		# visible part
+		x0, x1 = max(cx - sw/2, -W/2), min(cx + sw/2, W/2)
+		y0, y1 = max(cy - sh/2, -H/2), min(cy + sh/2, H/2)
+		if x0 >= x1 or y0 >= y1:
+			return None
+		k = w / sw
+		left, top = cx - sw/2, cy + sh/2
+		box = (
+			round((x0 - left) * k),
+			round((top - y1) * k),
+			round((x1 - left) * k),
+			round((top - y0) * k)
+		)
+		vw, vh = x1 - x0, y1 - y0
+		crop = self.factory.crop(path, box, vw, vh, self.album.resolution, filters)
+		return (crop, (x0 + x1) / 2, (y0 + y1) / 2, vw, vh)
+
+	def get_background_fill(self, page):
+		"""Get the visible part of a background in fill mode
+		(see get_fill())."""
+		return self.get_fill(page.background_image,
+			self.format.width, self.format.height, graph.Align.CENTER, 1.)
+
+	def include_image(self, path, width = None, height = None, keep = False):
+		"""Get the LaTeX to include an image with the given size in mm
+		(None to keep the aspect ratio). If keep is True, the image is
+		fitted in the size keeping its aspect ratio. Images used several
+		times are included from their saved box."""
+		box = self.image_boxes.get(path)
+		if box is not None and keep:
+			size = self.find_size(path)
+			if size is None:
+				box = None
+			else:
+				w, h = size
+				scale = min(width / w, height / h)
+				width, height = w * scale, h * scale
+		if box is None:
+			options = []
+			if width is not None:
+				options.append("width=%smm" % width)
+			if height is not None:
+				options.append("height=%smm" % height)
+			if keep:
+				options.append("keepaspectratio")
+			return "\\includegraphics[%s]{%s}" % (", ".join(options), self.make_path(path))
+		return "\\resizebox{%s}{%s}{\\usebox{%s}}" % (
+			"!" if width is None else "%smm" % width,
+			"!" if height is None else "%smm" % height,
+			box)
 
 	def get_page_center(self):
 		return (
@@ -277,7 +516,10 @@ class Drawer(graph.Drawer):
 		)
 
 	def make_path(self, path):
-		"""Build a path as much as possible relative to the album path."""
+		"""Build the path to include an image, as much as possible relative
+		to the album path. Images in a format not supported by pdflatex
+		are replaced by their conversion."""
+		path = self.factory.convert(path)
 		if os.path.isabs(path):
 			result = path
 		else:
@@ -290,79 +532,96 @@ class Drawer(graph.Drawer):
 				result = path
 		return result
 
+	def get_background(self, page):
+		"""Get the path of the image to use as background of the page.
+		If tiles are pre-rendered, this is the image covering the full
+		page. Return None if the tile is drawn by TikZ."""
+		if page.background_mode == graph.Mode.FILL:
+			return self.get_background_fill(page)[0]
+		elif page.background_mode != graph.Mode.TILE:
+			return page.background_image
+		elif self.album.prerender_tiles:
+			return self.factory.tile(page.background_image,
+				self.format.width, self.format.height, self.album.resolution)
+		else:
+			return None
+
+	def declare_background(self, page):
+		path = self.get_background(page)
+		if path is not None:
+			self.declare_image(path)
+
 	def gen_background_image(self, page):
 		write = self.out.write
-		path = page.background_image
-		inc_path = self.make_path(page.background_image)
+		path = self.get_background(page)
 
-		if page.background_mode == ptah.Mode.FIT:
+		if page.background_mode == graph.Mode.FIT:
 			cx, cy = self.get_page_center()
 			write("\\node[overlay, inner sep=0] at(%smm, %smm) {"
 				% (cx, cy))
-			write("\\includegraphics[width=%smm, height=%smm, keepaspectratio]{%s}};"
-				% (self.format.width, self.format.height, inc_path))
+			write("%s};" % self.include_image(path,
+				self.format.width, self.format.height, keep=True))
 
-		elif page.background_mode == ptah.Mode.STRETCH:
+		elif page.background_mode == graph.Mode.STRETCH \
+		or (page.background_mode == graph.Mode.TILE and path is not None):
 			write("\\node[overlay, inner sep=0, anchor=north west] at(%smm, %smm) {"
 				% (-self.width/2-self.lmargin, self.height/2+self.tmargin))
-			write("\\resizebox{%smm}{%smm}{\\includegraphics{%s}}};\n"
-				% (self.format.width, self.format.height, inc_path))
-
-		elif page.background_mode == ptah.Mode.FILL:
-			w, h = self.get_size(path)
-			W, H = self.format.width, self.format.height
-			# TODO manage align, scale, xshift, yshift
-			if w/h < W/H:
-				param = "width=\\paperwidth"
-			else:
-				param = "height=\\paperheight"
+			write("%s};\n" % self.include_image(path,
+				self.format.width, self.format.height))
+
+		elif page.background_mode == graph.Mode.FILL:
+			_, x, y, w, h = self.get_background_fill(page)
 			cx, cy = self.get_page_center()
-			write("\\node[overlay] at(%smm, %smm) {" % (cx, cy))
-			write("\\includegraphics[%s, keepaspectratio]{%s}};"
-				% (param, inc_path));
+			write("\\node[overlay, inner sep=0] at(%smm, %smm) {" % (cx + x, cy + y))
+			write("%s};" % self.include_image(path, w, h))
 
-		elif page.background_mode == ptah.Mode.TILE:
+		elif page.background_mode == graph.Mode.TILE:
 			x, y = self.get_bottom_left()
 			write("\\path[overlay, fill tile image=%s] (%smm, %smm) rectangle ++(%smm, %smm);\n"
-				% (inc_path, x, y, self.format.width, self.format.height));
+				% (self.make_path(page.background_image), x, y, self.format.width, self.format.height));
 
 	def border_props(self, style):
-		if style.border_style == ptah.BorderStyle.NONE:
+		if style.border_style == graph.BorderStyle.NONE:
 			return ""
 		else:
 			props = "draw=%s, inner sep = 0" \
 				% self.get_color(style.border_color)
-			if style.border_width == ptah.BorderWidth.MEDIUM:
+			if style.border_width == graph.BorderWidth.MEDIUM:
 				props += ", thick"
-			elif style.border_width == ptah.BorderWidth.THICK:
+			elif style.border_width == graph.BorderWidth.THICK:
 				props += ", ultra thick"
 			elif isinstance(style.border_width, graph.Length):
 				props += ",line width=%smm" % style.border_width.get(1.)
-			if style.border_style != ptah.BorderStyle.SOLID:
+			if style.border_style != graph.BorderStyle.SOLID:
 				props += ",%s" % BORDER_STYLES[style.border_style]
 			return props
 
-	def shadow_props(self, style):
-		if style.shadow == ptah.Shadow.SIMPLE:
+	def shadow_props(self, style, prerender = True):
+		"""Get the TikZ options drawing the shadow of a node. If prerender
+		is false, fuzzy shadows are drawn by TikZ even if they are
+		pre-rendered for the album."""
+		if style.shadow == graph.Shadow.SIMPLE:
 			opacity = style.shadow_opacity
 			if opacity == None:
 				opacity = .25
 			return ",drop shadow={" + \
 				"fill=%s" % self.get_color(style.shadow_color) + \
 				",opacity=%s" % opacity + \
-				",shadow xshift=%smm" % style.shadow_xoffset + \
-				",shadow yshift=%smm" % (-style.shadow_yoffset) + \
+				",shadow xshift=%smm" % self.get_shadow_offset(style)[0] + \
+				",shadow yshift=%smm" % (-self.get_shadow_offset(style)[1]) + \
 				"}"
-		elif style.shadow == ptah.Shadow.FUZZY:
+		elif style.shadow == graph.Shadow.FUZZY:
+			if prerender and self.prerenders_shadow(style):
+				return ""
 			opacity = style.shadow_opacity
 			if opacity == None:
 				opacity = 1.
-			radius = (style.shadow_xoffset + style.shadow_xoffset) / 3.
+			radius = self.get_blur_radius(style)
 			return ",blur shadow={" + \
 				"fill=%s" % self.get_color(style.shadow_color) + \
 				",opacity=%s" % opacity + \
-				",shadow xshift=%smm" % style.shadow_xoffset + \
-				",shadow yshift=%smm" % (-style.shadow_yoffset) + \
+				",shadow xshift=%smm" % self.get_shadow_offset(style)[0] + \
+				",shadow yshift=%smm" % (-self.get_shadow_offset(style)[1]) + \
 				", shadow blur radius=%smm" % radius + \
 				",shadow blur steps=10" + \
 				", shadow blur extra rounding=%smm" % radius + \
@@ -370,74 +629,92 @@ class Drawer(graph.Drawer):
 		else:
 			return ""
 
+	def get_shadow_offset(self, style):
+		"""Get the offset (dx, dy) in mm of the shadow of a frame, dy going
+		down. Used by both TikZ and pre-rendered shadows."""
+		return (get_length(style.shadow_xoffset), get_length(style.shadow_yoffset))
+
+	def get_blur_radius(self, style):
+		"""Get the blur radius (in mm) of a fuzzy shadow."""
+		xoffset = self.get_shadow_offset(style)[0]
+		return (xoffset + xoffset) / 3.
+
+	def prerenders_shadow(self, style):
+		"""Test if the shadow of the given style is drawn as an image."""
+		return style.shadow == graph.Shadow.FUZZY and self.album.prerender_shadows
+
+	def get_shadow(self, w, h, style):
+		"""Get the pre-rendered image of the fuzzy shadow of an image of
+		size w x h."""
+		opacity = style.shadow_opacity
+		if opacity == None:
+			opacity = 1.
+		return self.factory.shadow(w, h, self.get_blur_radius(style),
+			style.shadow_color, opacity, self.album.resolution)
+
+	def draw_shadow(self, x, y, w, h, style):
+		"""Draw the pre-rendered fuzzy shadow of an image of size w x h
+		centered at (x, y)."""
+		pad = images.get_shadow_pad(self.get_blur_radius(style))
+		dx, dy = self.get_shadow_offset(style)
+		self.out.write("\\node[inner sep=0] at(%smm, %smm) {%s};\n" % (
+			x + dx, y - dy,
+			self.include_image(self.get_shadow(w, h, style), w + 2 * pad, h + 2 * pad)))
+
 	def draw_border(self, x, y, W, H, style):
-		if style.border_style != ptah.BorderStyle.NONE:
+		if style.border_style != graph.BorderStyle.NONE:
 			self.out.write(
 				"\\draw[%s] (%smm,%smm) rectangle ++(%smm,%smm);\n" %
 				(self.border_props(style), x-W/2, y-H/2, W, H))
 
 	def draw_border_around(self, name, style):
-		if style.border_style != ptah.BorderStyle.NONE:
+		if style.border_style != graph.BorderStyle.NONE:
 			self.out.write(
 				"\\draw[%s] (%s.north west) rectangle (%s.south east);\n" %
 				(self.border_props(style), name, name))
 
 	def draw_image(self, path, box, style):
-		inc_path = self.make_path(path)
 		write = self.out.write
 		x, y = self.remap(box.centerx(), box.centery())
 		W, H = box.w, box.h
 		shadow = self.shadow_props(style)
 
 		# draw the image
-		if style.mode == ptah.Mode.FIT:
+		if style.mode == graph.Mode.FIT:
 			anchor,dx, dy = ALIGN[style.align](W, H)
+			size = None
+			if style.filter or self.prerenders_shadow(style):
+				size = self.get_fit_size(path, W, H)
+			if size is not None:
+				w, h = size
+				if style.filter:
+					path = self.factory.resize(path, w, h, self.album.resolution, style.filter)
+				if self.prerenders_shadow(style):
+					_, ddx, ddy = ALIGN[style.align](w, h)
+					self.draw_shadow(x + dx - ddx, y + dy - ddy, w, h, style)
+			elif self.prerenders_shadow(style):
+				shadow = self.shadow_props(style, prerender = False)
 			write("\\node[%s%s,inner sep=0] at(%smm, %smm) (A) {" \
 				% (anchor, shadow, x + dx, y + dy))
-			write("\\includegraphics[width=%smm, height=%smm, keepaspectratio]{%s}"
-				% (box.w, box.h, inc_path));
+			write(self.include_image(path, box.w, box.h, keep=True))
 			write("};\n")
 			self.draw_border_around("A", style)
 
-		elif style.mode == ptah.Mode.STRETCH:
+		elif style.mode == graph.Mode.STRETCH:
+			if style.filter:
+				path = self.factory.resize(path, W, H, self.album.resolution, style.filter)
 			write("\\node at(%smm, %smm) {" % (x, y))
-			write("\\resizebox{%smm}{%smm}{\\includegraphics{%s}}"
-				% (box.w, box.h, inc_path));
+			write(self.include_image(path, box.w, box.h))
 			write("};\n")
 			self.draw_border(x, y, W, H, style)
 
-		elif style.mode == ptah.Mode.FILL:
-
-			# compute configuration
-			w, h = self.get_size(path)
-			anchor,dx, dy = ALIGN[style.align](W, H)
-			if w/h < W/H:
-				sw = W * style.scale
-				param = "width=%smm" % sw
-				if style.xshift != None:
-					dx += style.xshift.get(sw)
-				if style.yshift != None:
-					sh = h * W / w * style.scale
-					dy -= style.yshift.get(sh)
-			else:
-				sh = H * style.scale
-				param = "height=%smm" % sh
-				if style.horizontal_shift != None:
-					sw = w * H / h * style.scale
-					dx += style.horizontal_shift.get(sw)
-				if style.vertical_shift != None:
-					dy -= style.vertical_shift.get(sh)
-
-			# generate the code
-			write("\\begin{scope}\n")
-			write("\\clip (%smm, %smm) rectangle(%smm, %smm);\n"
-				% (x - W/2, y - H/2, x + W/2, y + H/2))
-			write("\\node[%s] at(%smm, %smm) {"
-				% (anchor, x + dx, y + dy))
-			write("\\includegraphics[%s, keepaspectratio]{%s}"
-				% (param, inc_path));
-			write("};\n")
-			write("\\end{scope}\n")
+		elif style.mode == graph.Mode.FILL:
+			fill = self.get_fill(path, W, H, style.align, style.scale,
+				style.horizontal_shift, style.vertical_shift, style.filter)
+			if fill is not None:
+				crop, dx, dy, w, h = fill
+				write("\\node[inner sep=0] at(%smm, %smm) {%s};\n"
+					% (x + dx, y + dy, self.include_image(crop, w, h)))
 			self.draw_border(x, y, W, H, style)
 
 		else:
@@ -467,12 +744,15 @@ class Drawer(graph.Drawer):
 			style.font.use(self.out)
 		if style.text_color is not None:
 			write(f"\\color{{{self.get_color(style.text_color)}}} ")
-		parsed_text = self.text_syntax.parse(text)
-		if self.text_gen is None:
-			self.text_gen = ptah.text.Output(self.out)
-		self.text_gen.output(parsed_text)
+		write(self.text_cache.get(text))
 		write("};\n")
 
+	def begin_frame(self, frame):
+		name = frame.name
+		if name == "no name":
+			name = "#%d" % (frame.get_page().get_content().index(frame) + 1)
+		self.out.write(f"{FRAME_MARK}{name}\n")
+
 	def declare_color(self, color):
 		"""Declare a new used color."""
 		if color not in self.colors:
@@ -579,6 +859,7 @@ class DocDrawer(Drawer):
 	def __init__(self):
 		Drawer.__init__(self, Album("ptah.ptah"))
 		self.album.pages = []
+		self.pages = []
 
 		for col in graph.HTML_COLORS.values():
 			self.declare_color(col)
@@ -597,23 +878,15 @@ class DocDrawer(Drawer):
 			2)
 		self.mini_drawer = Drawer(self.mini)
 
-		# text support
-		self.text_syntax = ptah.text.Syntax()
-		self.text_gen = None
-
 	def gen(self):
 		self.gen_latex()
 		self.gen_pdf()
-		self.gen_pdf()
 
 	def gen_geometry(self):
 		pass
 
 	def write_text(self, text):
-		parsed_text = self.text_syntax.parse(text)
-		if self.text_gen is None:
-			self.text_gen = ptah.text.Output(self.out)
-		self.text_gen.output(parsed_text)
+		self.out.write(self.text_cache.get(text))
 
 	def gen_body(self):
 		write = self.out.write
@@ -651,7 +924,7 @@ class DocDrawer(Drawer):
 		# generate pages
 		all_props = Image.PROPS + Text.PROPS + Page.PROPS
 		write("\\section{Page types}\n")
-		for page in util.PAGE_MAP.values():
+		for page in plugin.PAGES.values():
 			inst = page(self.mini)
 
 			# generate miniature
@@ -0,0 +1,198 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Layout pass of the album.
+
+The layout pass maps the frames of each page, without generating
+anything, and produces a table of the geometry of the frames. This table
+is then used by the back-ends to generate the frames, but may also be
+used by any tool needing the position of frames (previews, etc).
+
+This module provides also the algorithms used to place images according
+to their aspect ratio (width / height)."""
+
+from collections import namedtuple
+
+from ptah import images
+
+
+Row = namedtuple("Row", ["page", "frame", "x", "y", "w", "h", "kind"])
+"""Geometry of a frame: page number, frame index in the page, position and
+size in mm relatively to the top-left corner of the page body, and kind of
+frame ("image", "text", etc)."""
+
+
+class Area:
+	"""Area of the page body the frames are mapped in. It provides the
+	same dimensions as a graph.Drawer."""
+
+	def __init__(self, format):
+		self.format = format
+		self.width = format.body_width()
+		self.height = format.body_height()
+		self.sep = format.column_sep
+
+
+class Table:
+	"""Table of the geometry of the frames of a collection of pages."""
+
+	def __init__(self):
+		self.rows = []
+		self.pages = {}
+
+	def __len__(self):
+		return len(self.rows)
+
+	def __iter__(self):
+		return iter(self.rows)
+
+	def add_page(self, page):
+		"""Add the rows of the frames of the given page, once mapped."""
+		start = len(self.rows)
+		for (i, frame) in enumerate(page.get_content()):
+			box = frame.box
+			if box is not None:
+				self.rows.append(Row(page.number, i, box.x, box.y, box.w, box.h, frame.KIND))
+		self.pages[page.number] = (start, len(self.rows))
+
+	def get_rows(self, page):
+		"""Get the rows of the given page."""
+		try:
+			start, end = self.pages[page.number]
+			return self.rows[start:end]
+		except KeyError:
+			return []
+
+
+def layout(album, pages = None):
+	"""Perform the layout of the given pages (default to all pages of the
+	album) and return the table of frames."""
+	if pages is None:
+		pages = album.pages
+	images.load_cache(album)
+	area = Area(album.format)
+	table = Table()
+	for page in pages:
+		for frame in page.get_content():
+			frame.box = None
+		page.map(area)
+		table.add_page(page)
+	return table
+
+
+def get_ratio(path):
+	"""Get the aspect ratio of the image at path from the image metadata
+	cache (without decoding the image). Return 1 if the image cannot
+	be read."""
+	if path is None:
+		return 1.
+	try:
+		w, h, _ = images.get_info(path)
+		return w / h
+	except (OSError, ZeroDivisionError):
+		return 1.
+
+
+def partition(weights, k):
+	"""Split the sequence of weights in k non-empty contiguous groups whose
+	sums are as close as possible (minimizing the sum of squared deviations
+	to the mean). Return the list of the indexes starting each group."""
+	n = len(weights)
+	k = max(1, min(k, n))
+	sums = [0.]
+	for w in weights:
+		sums.append(sums[-1] + w)
+	target = sums[-1] / k
+	INF = float("inf")
+
+	# cost[m][j]: best cost for the j first weights in m groups
+	cost = [[INF] * (n + 1) for _ in range(k + 1)]
+	back = [[0] * (n + 1) for _ in range(k + 1)]
+	cost[0][0] = 0.
+	for m in range(1, k + 1):
+		for j in range(m, n - (k - m) + 1):
+			for i in range(m - 1, j):
+				c = cost[m - 1][i]
+				if c == INF:
+					continue
+				d = sums[j] - sums[i] - target
+				c += d * d
+				if c < cost[m][j]:
+					cost[m][j] = c
+					back[m][j] = i
+
+	# rebuild the groups
+	starts = []
+	j = n
+	for m in range(k, 0, -1):
+		j = back[m][j]
+		starts.append(j)
+	starts.reverse()
+	return starts
+
+
+def justify_rows(ratios, starts, width, height, sep):
+	"""Place images of the given ratios in justified rows starting at the
+	given indexes, inside width x height with sep between images. Return
+	the list of boxes (x, y, w, h) of the images and the covered area."""
+	bounds = starts + [len(ratios)]
+	rows = []
+	for i in range(len(starts)):
+		group = ratios[bounds[i]:bounds[i + 1]]
+		rows.append((bounds[i], bounds[i + 1],
+			(width - sep * (len(group) - 1)) / sum(group)))
+
+	# scale down if too high
+	total = sum(h for (_, _, h) in rows)
+	avail = height - sep * (len(rows) - 1)
+	scale = min(1., avail / total)
+	y = (avail - total * scale) / 2
+
+	# compute the boxes
+	boxes = []
+	area = 0.
+	for (start, end, h) in rows:
+		h *= scale
+		group = ratios[start:end]
+		w = sum(group) * h + sep * (len(group) - 1)
+		x = (width - w) / 2
+		for r in group:
+			boxes.append((x, y, r * h, h))
+			area += r * h * h
+			x += r * h + sep
+		y += h + sep
+	return boxes, area
+
+
+def justify(ratios, width, height, sep, rows = None):
+	"""Place images of the given ratios in justified rows inside
+	width x height with sep between images. If rows is not given, the
+	number of rows covering the biggest area is selected. Return the list
+	of boxes (x, y, w, h) of the images."""
+	if not ratios:
+		return []
+	if rows is not None:
+		counts = [min(rows, len(ratios))]
+	else:
+		counts = range(1, len(ratios) + 1)
+	best, best_area = None, -1.
+	for k in counts:
+		boxes, area = justify_rows(ratios, partition(ratios, k), width, height, sep)
+		if area > best_area:
+			best, best_area = boxes, area
+	return best
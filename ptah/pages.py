@@ -4,7 +4,9 @@ from enum import Enum
 import os
 import ptah
 from ptah.album import Page, Text, Image
+from ptah.gprops import IMAGE_PROP
 from ptah import graph
+from ptah import layout
 from ptah import util
 from ptah import props
 from ptah.graph import *
@@ -141,7 +143,6 @@ class TrioPage(Page):
 			x[2] = 2*w + 2*drawer.sep
 		for i in range(0, 3):
 			self.get_item(i).map(Box(x[i], y[i], w, h))
-			self.get_item(i).gen(drawer)
 
 	def gen_miniature(drawer):
 		w, h = drawer.width, (drawer.height - 4)/3.
@@ -151,6 +152,64 @@ class TrioPage(Page):
 			y += h + 2
 
 
+# Mosaic page
+def parse_images(self, val, page, mon):
+	"""Parse a list of images."""
+	if isinstance(val, str) or not hasattr(val, "__iter__"):
+		raise util.CheckError(f"{self.id} in {page.get_location()} must be a list of images!")
+	return [props.parse_image(self, str(path), page, mon) for path in val]
+
+
+class MosaicPage(Page):
+
+	NAME = "mosaic"
+	IMAGES_PROP = props.Property("images",
+		"list of the images of the mosaic, placed in justified rows.", parse_images)
+	ROWS_PROP = props.IntProperty("rows",
+		"number of rows of the mosaic (default: the number of rows covering the biggest area).")
+	PROPS = Page.PROPS + Image.PROPS + [IMAGES_PROP, ROWS_PROP]
+	MAP = props.make(PROPS)
+
+	def __init__(self, album):
+		Page.__init__(self, album)
+		self.images = []
+		self.rows = None
+
+	def get_props_map(self):
+		return self.MAP
+
+	def parse(self, data, mon):
+		# frames must exist before parsing the per-image properties
+		images = data.get("images")
+		if isinstance(images, list):
+			for i in range(len(images)):
+				Image(self, name=f"image{i+1}")
+		Page.parse(self, data, mon)
+
+	def check(self, mon):
+		self.images = self.get_prop(self.IMAGES_PROP, direct=True, default=[])
+		for (frame, image) in zip(self.content, self.images):
+			frame.set_prop(IMAGE_PROP, image)
+		Page.check(self, mon)
+		self.rows = self.get_prop(self.ROWS_PROP, direct=True)
+		if self.rows is not None and self.rows < 1:
+			raise util.CheckError(f"rows must be positive in {self.get_location()}")
+
+	def map(self, drawer):
+		frames = [frame for frame in self.content if frame.image is not None]
+		ratios = [layout.get_ratio(frame.image) for frame in frames]
+		boxes = layout.justify(ratios, drawer.width, drawer.height, drawer.sep, self.rows)
+		for (frame, (x, y, w, h)) in zip(frames, boxes):
+			frame.map(Box(x, y, w, h))
+
+	def gen_miniature(drawer):
+		w, h = (drawer.width - 2) / 2., (drawer.height - 4) / 3.
+		drawer.draw_miniature_image("image1", Box(0, 0, drawer.width, h))
+		drawer.draw_miniature_image("image2", Box(0, h+2, w, h))
+		drawer.draw_miniature_image("image3", Box(w+2, h+2, w, h))
+		drawer.draw_miniature_image("image4", Box(0, 2*h+4, drawer.width, h))
+
+
 # Text page
 class OnlyTextPage(Page):
 
@@ -221,21 +280,18 @@ class TitlePage(Page):
 		if self.date.text is None:
 			self.date.text = self.get_album().get_date()
 
-	def gen(self, drawer):
+	def map(self, drawer):
 		x = drawer.width * self.title_left
 		w = drawer.width - x - drawer.width * self.title_right
 		h = drawer.height * self.title_bot
 		y = 0
 		self.title.map(Box(x, y, w, h))
-		self.title.gen(drawer)
 		y += h + self.interspace
 		if self.get_album().date != None:
 			self.date.map(Box(x, y, w, self.other_height))
-			self.date.gen(drawer)
 			y += self.other_height + self.interspace
 		if self.get_album().author != None:
 			self.author.map(Box(x, y, w, self.other_height))
-			self.author.gen(drawer)
 
 	def gen_miniature(drawer):
 		ht = drawer.height / 4
@@ -251,13 +307,4 @@ class TitlePage(Page):
 
 
 # Page initialization
-
-"""Known pages."""
-def add(cls):
-	util.PAGE_MAP[cls.NAME] = cls
-add(TitlePage)
-add(CenterPage)
-add(DuoPage)
-add(OnlyTextPage)
-add(BlankPage)
-add(TrioPage)
+# Pages are declared in ptah.plugin.PAGES and loaded on demand.
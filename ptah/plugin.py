@@ -0,0 +1,108 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Registries of plugins: page types and drawers (back-ends).
+
+Plugins are designed by references "module:attribute" and the module is
+only imported when the plugin is actually used. Other packages can
+provide plugins with entry points in groups "ptah.pages" and
+"ptah.drawers", for instance in their pyproject.toml:
+
+	[project.entry-points."ptah.pages"]
+	my-page = "my_package.pages:MyPage"
+
+Entry points are only scanned when a name is not found in built-in
+plugins."""
+
+import importlib
+
+
+class Registry:
+	"""Registry of a kind of plugins."""
+
+	def __init__(self, group, builtins):
+		self.group = group
+		self.refs = dict(builtins)
+		self.loaded = {}
+		self.scanned = False
+
+	def add(self, name, obj):
+		"""Add an already loaded plugin."""
+		self.loaded[name] = obj
+
+	def declare(self, name, ref):
+		"""Declare a plugin by its reference "module:attribute"."""
+		self.refs[name] = ref
+
+	def scan(self):
+		"""Look for plugins declared as entry points."""
+		if not self.scanned:
+			self.scanned = True
+			from importlib.metadata import entry_points
+			for point in entry_points(group=self.group):
+				if point.name not in self.refs:
+					self.refs[point.name] = point
+
+	def load(self, name):
+		"""Load the plugin with the given name."""
+		ref = self.refs[name]
+		if isinstance(ref, str):
+			module, attr = ref.split(":")
+			obj = getattr(importlib.import_module(module), attr)
+		else:
+			obj = ref.load()
+		self.loaded[name] = obj
+		return obj
+
+	def get(self, name):
+		"""Get the plugin with the given name, loading it if needed.
+		Raise KeyError if it cannot be found."""
+		try:
+			return self.loaded[name]
+		except KeyError:
+			pass
+		if name not in self.refs:
+			self.scan()
+		return self.load(name)
+
+	def names(self):
+		"""Get the names of all available plugins."""
+		self.scan()
+		return list(self.refs.keys()) \
+			+ [name for name in self.loaded if name not in self.refs]
+
+	def values(self):
+		"""Get all available plugins. All plugin modules are imported."""
+		return [self.get(name) for name in self.names()]
+
+
+PAGES = Registry("ptah.pages", {
+	"title":		"ptah.pages:TitlePage",
+	"center":		"ptah.pages:CenterPage",
+	"duo":			"ptah.pages:DuoPage",
+	"only-text":	"ptah.pages:OnlyTextPage",
+	"blank":		"ptah.pages:BlankPage",
+	"trio":			"ptah.pages:TrioPage",
+	"mosaic":		"ptah.pages:MosaicPage"
+})
+"""Registry of page types."""
+
+DRAWERS = Registry("ptah.drawers", {
+	"latex":		"ptah.latex:Drawer"
+})
+"""Registry of drawers, that is, back-ends generating the album."""
@@ -32,9 +32,7 @@ import os
 import os.path
 import re
 import sys
-import traceback
 
-import ptah.font
 from ptah.util import CheckError, normalize
 from ptah import graph
 from ptah import io
@@ -104,6 +102,31 @@ def parse_float(self, val, obj, mon):
 	except ValueError:
 		raise CheckError(f"value {self.id} of {obj.get_location()} should be a floatting-pointer number")
 
+def parse_int(self, val, obj, mon):
+	try:
+		return int(val)
+	except ValueError:
+		raise CheckError(f"value {self.id} of {obj.get_location()} should be an integer")
+
+
+SIZE_RE = re.compile(r"([0-9\.]+)\s*([kKmMgG]?)[bB]?$")
+
+SIZE_UNITS = {
+	"": 1,
+	"k": 1 << 10,
+	"m": 1 << 20,
+	"g": 1 << 30
+}
+
+def parse_size(self, val, obj, mon):
+	"""Parse a size in bytes like 1200, 500k, 150M or 1.5G."""
+	if isinstance(val, int):
+		return val
+	m = SIZE_RE.match(str(val).strip())
+	if m != None:
+		return int(float(m.group(1)) * SIZE_UNITS[m.group(2).lower()])
+	raise CheckError(f"bad size for {self.id} in {obj.get_location()}")
+
 
 LENGTH_RE = re.compile(r"([+-]?[0-9\.]?)([a-zA-Z]+)")
 
@@ -125,6 +148,12 @@ def parse_image(self, path, page, mon):
 		raise CheckError(f"image {path} in {page.get_location()} cannot be found!")
 	return actual_path
 
+def parse_file(self, path, obj, mon):
+	actual_path = obj.get_album().find(path)
+	if actual_path is None:
+		raise CheckError(f"file {path} in {obj.get_location()} cannot be found!")
+	return actual_path
+
 def parse_penum(cls):
 	"""Type support for a Python enumeration."""
 	map = { normalize(x.name): x for x in cls }
@@ -133,6 +162,7 @@ def parse_penum(cls):
 			return map[normalize(val).strip()]
 		except KeyError:
 			raise CheckError(f"{val} in {obj.name} must be one of {', '.join([normalize(x.name) for x in cls])}")
+	convert.enum = cls
 	return convert
 
 def help_penum(msg, cls, default=None):
@@ -196,6 +226,7 @@ def parse_union(parsers):
 			except CheckError:
 				pass
 		raise CheckError(f"cannot parse {self.id} in {obj.get_location()}")
+	fun.parsers = parsers
 	return fun
 
 def parse_percent(self, val, obj, mon):
@@ -218,7 +249,8 @@ FONT_WITH_ERROR = set()
 def parse_font(self, val, obj, mon):
 	"""Convert val to a font. Display a warning if the
 	font does not exists and returns None."""
-	val = ptah.util.normalize(val).strip()
+	import ptah.font
+	val = normalize(val).strip()
 	font = ptah.font.find(val)
 	if font is not None:
 		return font
@@ -235,6 +267,10 @@ def StringProperty(id, desc, mode = 0):
 	return Property(id, desc, parse_string, mode)
 def FloatProperty(id, desc, mode = 0):
 	return Property(id, desc, parse_float, mode)
+def IntProperty(id, desc, mode = 0):
+	return Property(id, desc, parse_int, mode)
+def SizeProperty(id, desc, mode = 0):
+	return Property(id, desc, parse_size, mode)
 def ColorProperty(id, desc, mode = 0):
 	return Property(id, desc, parse_color, mode)
 def LengthProperty(id, desc, mode = 0):
@@ -299,35 +335,39 @@ class Map:
 			else:
 				return default
 
+	def get_schema(self):
+		"""Get the compiled schema of the properties of the map."""
+		from ptah.schema import compile
+		return compile(self.get_props_map())
+
 	def parse_prop(self, key, val, mon):
 		"""Parse a single property."""
-		try:
-			prop = self.get_props_map()[key]
-			val = prop.parse(val, self, mon)
-			self.set_prop(prop, val)
-		except KeyError:
+		schema = self.get_schema()
+		prop = schema.get(key)
+		if prop is None:
 			mon.print_warning(f"no property {key} in {self.get_location()}. Ignoring it.")
+			return
+		try:
+			self.set_prop(prop, schema.parse(prop, val, self, mon))
 		except CheckError as e:
 			mon.print_warning(f"bad value {val} for {key} in page {self.get_location()}. Value must be {prop.desc}.")
 
 	def parse(self, data, mon):
 		"""Parse the given data, a dictionary of (key, value) and built
 		corresponding properties. All error displayed on monitor mon."""
+		schema = self.get_schema()
 
 		for (key, val) in data.items():
-			p = key.find('#')
+			id, i = schema.split(key)
 
-			if p < 0:
+			if i is None:
 				self.parse_prop(key, val, mon)
 
+			elif i < 0:
+				mon.print_warning(f"bad number in {key} of {self.get_location()}. Ignoring it.")
+
 			else:
-				id = key[:p]
-				try:
-					i = int(key[p+1:]) - 1
-					item = self.get_item(i)
-					item.parse_prop(id, val, mon)
-				except ValueError:
-					mon.print_warning(f"bad number in {key} of {self.get_location()}. Ignoring it.")
+				self.get_item(i).parse_prop(id, val, mon)
 
 		# check the properties
 		self.check(mon)
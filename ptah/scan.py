@@ -0,0 +1,198 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Generation of an album from a directory of photos (ptah init).
+
+The photos of the directory are scanned in a thread pool, reading only
+the header of the images (size, EXIF orientation and capture time). These
+information are kept in the cache of the album so that scanning again a
+directory only reads the new or modified photos. The photos are then
+sorted by capture time, grouped by day or by time gaps, and each group is
+split in pages as a flow (see ptah.flow)."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
+import os.path
+import yaml
+
+from ptah import flow, images, layout, util
+from ptah.album import Album
+
+IMAGE_EXTS = {
+	".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp", ".avif",
+	".heic", ".heif", ".gif", ".bmp"
+}
+"""Extensions of the files considered as photos."""
+
+TIMES = images.Store("times.json")
+"""Capture time (timestamp) of the photos."""
+
+EXIF_TIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+
+def walk(dir):
+	"""Find recursively the photos in dir (hidden directories excluded).
+	Return the paths of the photos."""
+	res = []
+	with os.scandir(dir) as entries:
+		for entry in entries:
+			if entry.name.startswith("."):
+				continue
+			elif entry.is_dir():
+				res += walk(entry.path)
+			elif entry.is_file() \
+			and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS:
+				res.append(entry.path)
+	return res
+
+
+def get_time(exif, path):
+	"""Get the capture time of a photo from its EXIF data, default to the
+	modification time of the file."""
+	text = exif.get_ifd(0x8769).get(0x9003) or exif.get(0x0132)
+	if text is not None:
+		try:
+			return datetime.strptime(str(text).strip("\0 "), EXIF_TIME_FORMAT).timestamp()
+		except ValueError:
+			pass
+	return os.path.getmtime(path)
+
+
+def read_header(path):
+	"""Read the header of the photo at path and return (width, height,
+	time). The information is memoized as long as the file does not change.
+	Raise one of images.get_errors() if the photo cannot be read."""
+	key = images.INFOS.get_key(path)
+	info = images.INFOS.get(key)
+	time = TIMES.get(key)
+	if info is None or time is None:
+		with images.open_image(path) as image:
+			exif = image.getexif()
+			info = images.read_info(image, exif)
+			time = get_time(exif, path)
+		images.INFOS.set(key, info)
+		TIMES.set(key, time)
+	return info[0], info[1], time
+
+
+def scan(paths, mon):
+	"""Read in parallel the headers of the photos of paths. Return the list
+	of (path, ratio, time) of the readable photos sorted by time."""
+	def read(path):
+		try:
+			return read_header(path)
+		except images.get_errors() as e:
+			mon.print_warning(f"cannot read {path}: {e}. Ignoring it.")
+			return None
+
+	with ThreadPoolExecutor() as pool:
+		headers = list(pool.map(read, paths))
+	res = []
+	for (path, header) in zip(paths, headers):
+		if header is not None:
+			w, h, time = header
+			res.append((path, w / h, time))
+	res.sort(key=lambda photo: (photo[2], photo[0]))
+	return res
+
+
+def group(photos, gap = None):
+	"""Group the photos, sorted by time, in lists of photos taken the same
+	day or, if gap (in s) is given, separated by at most gap."""
+	groups = []
+	last = None
+	for photo in photos:
+		time = photo[2]
+		if last is None:
+			new = True
+		elif gap is None:
+			new = datetime.fromtimestamp(time).date() != datetime.fromtimestamp(last).date()
+		else:
+			new = time - last > gap
+		if new:
+			groups.append([])
+		groups[-1].append(photo)
+		last = time
+	return groups
+
+
+def format_date(time):
+	"""Format a timestamp as a date of the album."""
+	return datetime.fromtimestamp(time).strftime("%d/%m/%Y")
+
+
+def describe(album, dir, groups):
+	"""Build the description of the album of the given groups of photos in
+	directory dir."""
+	area = layout.Area(album.format)
+	pages = [{"name": "title", "type": "title"}]
+	for (i, photos) in enumerate(groups):
+		prefix = f"group{i + 1}"
+		if len(groups) > 1:
+			pages.append({
+				"name": prefix,
+				"type": "only-text",
+				"text": format_date(photos[0][2])
+			})
+		paths = [os.path.relpath(path, dir) for (path, _, _) in photos]
+		for (j, (model, start, end)) in enumerate(paginate(photos, area)):
+			pages.append(flow.describe(model, paths[start:end], j, prefix))
+	desc = {
+		"title": os.path.basename(os.path.abspath(dir)),
+		"date": format_date(groups[0][0][2]) if groups else None,
+		"format": album.format.name.lower(),
+		"paths": [os.path.relpath(dir, album.get_base())],
+		"pages": pages
+	}
+	return desc
+
+
+def paginate(photos, area):
+	"""Split the photos in pages of area (see flow.paginate())."""
+	return flow.paginate([ratio for (_, ratio, _) in photos], area)
+
+
+def init(dir, mon, gap = None, force = False):
+	"""Generate the album XXX.ptah, next to directory XXX, from the photos
+	it contains. gap is the time gap (in s) splitting the groups of photos
+	(default to group by day). An existing album is only overwritten if
+	force is true. Return the path of the album. Raise util.CheckError in
+	case of error."""
+	if not os.path.isdir(dir):
+		raise util.CheckError(f"{dir} is not a directory!")
+	path = os.path.relpath(os.path.abspath(dir) + ".ptah")
+	if os.path.exists(path) and not force:
+		raise util.CheckError(f"{path} already exists!")
+	album = Album(path)
+
+	# scan the photos
+	cache = album.get_work_dir("cache")
+	images.INFOS.load(cache)
+	TIMES.load(cache)
+	photos = scan(walk(dir), mon)
+	images.INFOS.save(cache)
+	TIMES.save(cache)
+	if not photos:
+		raise util.CheckError(f"no photo found in {dir}!")
+
+	# write the album
+	desc = describe(album, dir, group(photos, gap))
+	with open(path, "w") as out:
+		yaml.safe_dump(desc, out, sort_keys=False, allow_unicode=True)
+	return path
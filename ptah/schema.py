@@ -0,0 +1,239 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Compiled schemas of property maps.
+
+A schema is built once for each property map (see props.make()) and
+speeds up the parsing of the maps:
+* the keys, possibly indexed like "image#2", are split once,
+* the values of properties whose parsing does not depend on the parsed
+  object (enumerations, lengths, numbers, etc) are parsed once and the
+  result is shared,
+* colors given as #RRGGBB are checked with a single regular expression.
+
+The schemas are also used to export the syntax of the album files as a
+JSON Schema (https://json-schema.org) used by editors to validate the
+albums."""
+
+import re
+
+from ptah import props
+from ptah.gprops import parse_filter
+from ptah.util import normalize
+
+PURE_PARSERS = {
+	props.parse_bool,
+	props.parse_float,
+	props.parse_int,
+	props.parse_size,
+	props.parse_length,
+	props.parse_percent,
+	props.parse_string,
+	parse_filter
+}
+"""Parsers whose result only depends on the parsed value."""
+
+JSON_TYPES = {
+	props.parse_bool: {"type": "boolean"},
+	props.parse_float: {"type": "number"},
+	props.parse_int: {"type": "integer"},
+	props.parse_size: {"type": ["integer", "string"], "pattern": props.SIZE_RE.pattern},
+	props.parse_length: {"type": ["number", "string"]},
+	props.parse_percent: {"type": ["number", "string"]},
+	props.parse_string: {"type": "string"},
+	props.parse_image: {"type": "string"},
+	props.parse_file: {"type": "string"},
+	props.parse_color: {"type": "string"},
+	props.parse_font: {"type": "string"},
+	parse_filter: {"type": ["string", "array"]}
+}
+"""JSON Schema of the values of the parsers."""
+
+HEX_COLOR_RE = re.compile(r"\s*#[0-9a-fA-F]{6}\s*$")
+LATEX_RE = re.compile(r"\\texttt\{([^}]*)\}|\\(%)")
+
+
+def is_pure(fun):
+	"""Test if the result of the parser fun only depends on the value."""
+	if hasattr(fun, "enum"):
+		return True
+	elif hasattr(fun, "parsers"):
+		return all(is_pure(parser) for parser in fun.parsers)
+	else:
+		return fun in PURE_PARSERS
+
+
+def get_json_type(fun):
+	"""Get the JSON Schema of the values of the parser fun."""
+	if hasattr(fun, "enum"):
+		return {"enum": [normalize(x.name) for x in fun.enum]}
+	elif hasattr(fun, "parsers"):
+		return {"anyOf": [get_json_type(parser) for parser in fun.parsers]}
+	else:
+		return dict(JSON_TYPES.get(fun, {}))
+
+
+def get_description(prop):
+	"""Get the description of a property as plain text."""
+	return LATEX_RE.sub(lambda m: m.group(1) or m.group(2), prop.get_description())
+
+
+class Schema:
+	"""Compiled schema of a property map."""
+
+	def __init__(self, map):
+		self.map = map
+		self.keys = {}
+		self.values = {
+			prop: {}
+			for prop in map.values() if is_pure(prop.fun)
+		}
+
+	def get(self, id):
+		"""Get the property with the given identifier, None if there is
+		none."""
+		return self.map.get(id)
+
+	def split(self, key):
+		"""Split a key in (identifier, index). The index is None for a
+		non-indexed key and negative if the index is not valid."""
+		try:
+			return self.keys[key]
+		except KeyError:
+			pass
+		p = key.find('#')
+		if p < 0:
+			res = (key, None)
+		else:
+			try:
+				res = (key[:p], max(-1, int(key[p+1:]) - 1))
+			except ValueError:
+				res = (key[:p], -1)
+		self.keys[key] = res
+		return res
+
+	def parse(self, prop, val, obj, mon):
+		"""Parse the value val of property prop for the object obj.
+		Raise CheckError if the value is not valid."""
+		if prop.fun is props.parse_color \
+		and isinstance(val, str) and HEX_COLOR_RE.match(val):
+			return val.strip().lower()
+		values = self.values.get(prop)
+		if values is not None:
+			key = (type(val), val)
+			try:
+				return values[key]
+			except KeyError:
+				pass
+			except TypeError:
+				values = None
+		res = prop.parse(val, obj, mon)
+		if values is not None:
+			values[key] = res
+		return res
+
+	def to_json(self, items = (), overrides = {}):
+		"""Export the schema as a JSON Schema object. items is the list of
+		the maps of the items that can be accessed with indexed keys and
+		overrides gives the schema of some properties by identifier."""
+		res = {
+			"type": "object",
+			"properties": {
+				id: get_property_json(prop, overrides)
+				for (id, prop) in self.map.items()
+			},
+			"additionalProperties": False
+		}
+		patterns = {}
+		for map in items:
+			for (id, prop) in map.items():
+				patterns[f"^{re.escape(id)}#[1-9][0-9]*$"] = get_property_json(prop, overrides)
+		if patterns:
+			res["patternProperties"] = patterns
+		return res
+
+
+def get_property_json(prop, overrides = {}):
+	"""Get the JSON Schema of a property."""
+	try:
+		res = dict(overrides[prop.id])
+	except KeyError:
+		res = get_json_type(prop.fun)
+	res["description"] = get_description(prop)
+	return res
+
+
+SCHEMAS = {}
+
+def compile(map):
+	"""Get the compiled schema of the given property map."""
+	try:
+		return SCHEMAS[id(map)]
+	except KeyError:
+		schema = Schema(map)
+		SCHEMAS[id(map)] = schema
+		return schema
+
+
+def album_json():
+	"""Build the JSON Schema of the album files."""
+	from ptah import plugin
+	from ptah.album import Album, Default, Image, Style
+
+	album = Album("album.ptah")
+	strings = {"type": "array", "items": {"type": "string"}}
+	include = {
+		"type": "object",
+		"properties": {"include": {"type": "string"}},
+		"required": ["include"]
+	}
+
+	# build the pages schema
+	names = plugin.PAGES.names()
+	cases = [{"properties": {"type": {"enum": names}}}]
+	for name in names:
+		page = plugin.PAGES.get(name)(album)
+		items = [frame.get_props_map() for frame in page.get_content()]
+		if not items:
+			items = [Image.MAP]
+		then = compile(page.get_props_map()).to_json(items)
+		cond = {"properties": {"type": {"const": name}}, "required": ["type"]}
+		if name == "center":
+			cond = {"anyOf": [cond, {"not": {"required": ["type"]}}]}
+		cases.append({"if": cond, "then": then})
+	page = {
+		"if": {"anyOf": [{"required": ["include"]}, {"required": ["repeat"]}]},
+		"then": {"type": "object"},
+		"else": {"allOf": cases}
+	}
+
+	# build the album schema
+	style = compile(Style.MAP).to_json()
+	style["required"] = ["name"]
+	res = compile(Album.MAP).to_json(overrides = {
+		"pages": {"type": "array", "items": page},
+		"flow": strings,
+		"paths": strings,
+		"templates": {"type": "array", "items": {"type": "object", "required": ["template"]}},
+		"styles": {"type": "array", "items": {"anyOf": [include, style]}},
+		"colors": {"type": "object", "additionalProperties": {"type": "string"}},
+		"default": compile(Default.MAP).to_json()
+	})
+	res["$schema"] = "https://json-schema.org/draft/2020-12/schema"
+	res["title"] = "ptah album"
+	return res
@@ -0,0 +1,111 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Page templates and their repetition.
+
+A template is a page description, named by its "template" key, whose
+strings may contain variables $VAR or ${VAR}. A page entry
+"repeat: TEMPLATE" with "for-each: SOURCE" produces a page for each item
+of the source that is either:
+* a CSV file whose first line gives the names of the variables,
+* a glob pattern of images, relative to the paths of the album, giving
+  variables "image" (path of the image), "name" (file name without
+  extension) and "index" (starting at 1).
+
+The other keys of the repeat entry are added to each page. Pages are
+produced one by one, while the CSV file is read or the images found, so
+that the page descriptions are never built all at once."""
+
+import csv
+import glob
+import os.path
+import string
+
+from ptah.util import CheckError
+
+REPEAT_KEYS = {"repeat", "for-each"}
+"""Keys of a repeat entry that are not page properties."""
+
+
+def substitute(val, vars):
+	"""Replace the variables in the strings of val (possibly in lists or
+	dictionaries). Unknown variables are left unchanged."""
+	if isinstance(val, str):
+		return string.Template(val).safe_substitute(vars)
+	elif isinstance(val, dict):
+		return {key: substitute(x, vars) for (key, x) in val.items()}
+	elif isinstance(val, list):
+		return [substitute(x, vars) for x in val]
+	else:
+		return val
+
+
+def read_csv(path):
+	"""Produce the rows of a CSV file as dictionaries."""
+	with open(path, newline="") as file:
+		for row in csv.DictReader(file):
+			yield row
+
+
+def find_images(pattern, album):
+	"""Produce the variables for each image matching the pattern in the
+	paths of the album."""
+	index = 1
+	for base in album.paths:
+		for path in sorted(glob.iglob(os.path.join(base, pattern))):
+			rel = os.path.relpath(path, base)
+			yield {
+				"image": rel,
+				"name": os.path.splitext(os.path.basename(rel))[0],
+				"index": str(index)
+			}
+			index += 1
+
+
+def get_source(desc, album):
+	"""Get the producer of variables of the for-each of a repeat entry."""
+	try:
+		source = str(desc["for-each"])
+	except KeyError:
+		raise CheckError(f"repeat of {desc['repeat']} requires a for-each in {album.get_location()}!")
+	if source.lower().endswith(".csv"):
+		path = album.find(source)
+		if path is None:
+			raise CheckError(f"cannot find {source} in {album.get_location()}!")
+		return read_csv(path)
+	else:
+		return find_images(source, album)
+
+
+def expand(desc, album):
+	"""Produce the page descriptions of a repeat entry. Raise CheckError
+	if the template is unknown or the source cannot be read."""
+	name = str(desc["repeat"])
+	template = album.get_template(name)
+	if template is None:
+		raise CheckError(f"template {name} is unknown in {album.get_location()}!")
+	extra = {key: val for (key, val) in desc.items() if key not in REPEAT_KEYS}
+	try:
+		for (i, vars) in enumerate(get_source(desc, album)):
+			page = substitute(template, vars)
+			page.update(substitute(extra, vars))
+			if "name" not in page:
+				page["name"] = f"{name}-{i + 1}"
+			yield page
+	except (OSError, csv.Error) as e:
+		raise CheckError(f"cannot repeat {name} in {album.get_location()}: {e}")
@@ -0,0 +1,104 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Parsing of the log produced by TeX engines.
+
+The log is expected to be produced with -file-line-error option but classic
+"! message" errors are also supported."""
+
+import re
+
+FILE_LINE_RE = re.compile(r"^(.*\.(?:tex|sty|cls|def|cfg|code\.tex)):([0-9]+): (.*)$")
+CLASSIC_RE = re.compile(r"^! (.*)$")
+CONTEXT_RE = re.compile(r"^l\.([0-9]+) ?(.*)$")
+
+
+class TexError:
+	"""Error found in a TeX log."""
+
+	def __init__(self, msg, file = None, line = None, context = None):
+		self.msg = msg
+		self.file = file
+		self.line = line
+		self.context = context
+		self.location = None
+
+	def __str__(self):
+		res = self.msg
+		if self.line is None:
+			pass
+		elif self.file is None:
+			res = f"line {self.line}: {res}"
+		else:
+			res = f"{self.file}:{self.line}: {res}"
+		if self.context:
+			res = f"{res} (near \"{self.context}\")"
+		if self.location is not None:
+			res = f"{self.location}: {res}"
+		return res
+
+	def __repr__(self):
+		return f"TexError({self.file}, {self.line}, {self.msg!r})"
+
+
+def parse(lines):
+	"""Parse the lines of a TeX log and return the list of found errors."""
+	errors = []
+	current = None
+	in_msg = False
+	for line in lines:
+		line = line.rstrip("\n")
+
+		# new error
+		m = FILE_LINE_RE.match(line)
+		if m is not None:
+			current = TexError(m.group(3), m.group(1), int(m.group(2)))
+		else:
+			m = CLASSIC_RE.match(line)
+			if m is not None:
+				current = TexError(m.group(1))
+		if m is not None:
+			errors.append(current)
+			in_msg = True
+			continue
+		if current is None:
+			continue
+
+		# error continuation
+		m = CONTEXT_RE.match(line)
+		if m is not None:
+			if current.line is None:
+				current.line = int(m.group(1))
+			current.context = m.group(2).strip()
+			current = None
+		elif not line.strip() or line.startswith("<"):
+			in_msg = False
+		elif in_msg:
+			current.msg = f"{current.msg} {line.strip()}"
+
+	return errors
+
+
+def read(path):
+	"""Read the errors from the log file at the given path. Return an empty
+	list if the log cannot be read."""
+	try:
+		with open(path, encoding="utf-8", errors="replace") as file:
+			return parse(file)
+	except OSError:
+		return []
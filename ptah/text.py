@@ -16,12 +16,13 @@
 #	along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
-"""Classes managing text. It is currently based on Thot."""
+"""Classes managing text. Texts using only the documented subset of
+Markdown (bold, italic and paragraphs) are directly converted to LaTeX.
+Other texts are processed by Thot that is only imported when needed."""
 
-from thot.common import Env
-from thot.doc import Document, Par
-from thot.tparser import Manager
-from thot.back import get_output
+from collections import OrderedDict
+import io
+import re
 
 class Text:
 	"""Text ready to be displayed as a result of syntax parsing."""
@@ -38,6 +39,9 @@ class Syntax:
 	"""Syntax to read a text."""
 
 	def __init__(self, syntax="markdown"):
+		from thot.common import Env
+		from thot.doc import Document
+		from thot.tparser import Manager
 		self.syntax = syntax
 		self.doc = Document(Env())
 		self.manager = Manager(self.doc)
@@ -45,6 +49,7 @@ class Syntax:
 
 	def parse(self, text):
 		"""Parse the passed text and returns corresponding Text object."""
+		from thot.doc import Par
 		lines = [l + '\n' for l in text.split('\n')]
 		self.doc.clear()
 		self.doc.append(Par())
@@ -65,8 +70,160 @@ class Output:
 		"""Output the text to the passed output.
 		Raises ThotException in case of error."""
 		if self.gen is None:
+			from thot.back import get_output
 			self.doc = text.syntax.doc
 			self.doc.env["THOT_OUT_TYPE"] = self.type
 			self.gen = get_output(self.doc).Generator(self.doc, out=self.out)
 		for node in text.range:
 			node.gen(self.gen)
+
+
+CACHE_SIZE = 1024
+"""Default number of texts kept in the cache."""
+
+EXTENDED_RE = re.compile(r"[`\[\]<\\|]|^\s*(#|>|[-+*]\s|[0-9]+\.\s|([-*_]\s*){3,}$)",
+	re.MULTILINE)
+"""Matches texts using Markdown features beyond the built-in subset."""
+
+PAR_RE = re.compile(r"\n\s*\n")
+TOKEN_RE = re.compile(r"\*+|_+|[{}$&#^~%]")
+SPECIAL_RE = re.compile(r"[{}$&#^~%_]")
+
+ESCAPES = {
+	"{": "\\{",
+	"}": "\\}",
+	"$": "\\$",
+	"&": "\\&",
+	"#": "\\#",
+	"%": "\\%",
+	"^": "\\textasciicircum{}",
+	"~": "\\textasciitilde{}",
+	"_": "\\_"
+}
+
+STYLES = {
+	"**": "\\textbf{",
+	"__": "\\textbf{",
+	"*": "\\textit{",
+	"_": "\\textit{"
+}
+
+
+def escape(text):
+	"""Escape LaTeX special characters of a text without markup."""
+	return SPECIAL_RE.sub(lambda m: ESCAPES[m.group()], text)
+
+
+def render_par(par):
+	"""Render a paragraph of the Markdown subset to LaTeX in one pass.
+	A run of delimiters first closes the innermost opened emphasis it
+	can close, then opens bold and italic emphasis with what remains.
+	Unmatched emphasis delimiters are output as is."""
+	out = []
+	stack = []
+	pos = 0
+	for m in TOKEN_RE.finditer(par):
+		out.append(par[pos:m.start()])
+		pos = m.end()
+		run = m.group()
+		if run[0] not in "*_":
+			out.append(ESCAPES[run])
+			continue
+		before = par[m.start() - 1] if m.start() > 0 else " "
+		after = par[pos] if pos < len(par) else " "
+		n = len(run)
+
+		# close the innermost opened emphasis first
+		if not before.isspace() and not (run[0] == "_" and after.isalnum()):
+			while n:
+				opened = [i for i, (t, _) in enumerate(stack)
+					if t[0] == run[0] and len(t) <= n]
+				if not opened:
+					break
+				del stack[opened[-1] + 1:]
+				token, index = stack.pop()
+				out[index] = STYLES[token]
+				out.append("}")
+				n -= len(token)
+
+		# open emphasis with the rest, bold first
+		if n and not after.isspace() and not (run[0] == "_" and before.isalnum()):
+			for token in [run[0] * 2] * (n // 2) + [run[0]] * (n % 2):
+				stack.append((token, len(out)))
+				out.append(escape(token))
+		elif n:
+			out.append(escape(run[0] * n))
+
+	out.append(par[pos:])
+	return "".join(out)
+
+
+def render(text):
+	"""Render a text using the Markdown subset (bold, italic, paragraphs)
+	to LaTeX. Return None if the text uses other Markdown features."""
+	if EXTENDED_RE.search(text) is not None:
+		return None
+	return "\n\n".join(render_par(par.strip()) for par in PAR_RE.split(text.strip()))
+
+
+class Cache:
+	"""Bounded cache of texts converted to LaTeX. Texts only using the
+	Markdown subset are rendered by render(), other ones by Thot. If Thot
+	is not installed, they are rendered as the subset."""
+
+	def __init__(self, size=CACHE_SIZE, type="latex", mon=None):
+		self.size = size
+		self.type = type
+		self.mon = mon
+		self.map = OrderedDict()
+		self.syntax = None
+		self.output = None
+		self.buf = None
+		self.hits = 0
+		self.misses = 0
+		self.builtin = 0
+
+	def convert(self, text):
+		"""Convert the text with the Thot parser."""
+		if self.syntax is None:
+			self.syntax = Syntax()
+			self.buf = io.StringIO()
+			self.output = Output(self.buf, self.type)
+		self.buf.seek(0)
+		self.buf.truncate()
+		self.output.output(self.syntax.parse(text))
+		return self.buf.getvalue()
+
+	def get(self, text):
+		"""Get the LaTeX corresponding to the given text."""
+		try:
+			res = self.map[text]
+			self.map.move_to_end(text)
+			self.hits += 1
+			return res
+		except KeyError:
+			self.misses += 1
+		res = render(text)
+		if res is not None:
+			self.builtin += 1
+		else:
+			try:
+				res = self.convert(text)
+			except ImportError:
+				if self.mon is not None:
+					self.mon.print_warning(f"thot is not installed: \"{text}\" "
+						"is rendered with bold, italic and paragraphs only.")
+				res = "\n\n".join(render_par(par.strip())
+					for par in PAR_RE.split(text.strip()))
+		self.map[text] = res
+		if len(self.map) > self.size:
+			self.map.popitem(last=False)
+		return res
+
+	def get_stats(self):
+		"""Get a string giving statistics about the cache use."""
+		total = self.hits + self.misses
+		if total == 0:
+			return "no text"
+		return f"{total} texts, {self.hits} hits ({self.hits * 100 // total}%), " \
+			f"{self.builtin} built-in"
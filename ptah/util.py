@@ -4,6 +4,7 @@ from string import Template
 import sys
 
 DEBUG = False
+PROFILE = False
 
 def generate(templ, **args):
 	"""Generate the given template with the passed arguments."""
@@ -91,9 +92,16 @@ def normalize(s):
 	"""Normalize s to lower case and remove spaces."""
 	return s.lower().replace(' ', '').replace('_', '-')
 
+def alpha(n):
+	"""Convert a number to a string of letters (A, B, ..., Z, BA, BB, ...),
+	usable in LaTeX command names."""
+	res = chr(ord('A') + n % 26)
+	while n >= 26:
+		n //= 26
+		res = chr(ord('A') + n % 26) + res
+	return res
+
 def enum_list(cls):
 	"""Return a string representing the list of enumerated values."""
 	return ", ".join([normalize(x.name) for x in cls])
 
-PAGE_MAP = {
-}
@@ -0,0 +1,155 @@
+#
+#	Ptah -- Photo album generator
+#	Copyright (C) 2022 Hugues Cassé <hug.casse@gmail.com>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Splitting of big albums in several volumes.
+
+A volume is a contiguous range of pages generated as its own PDF file.
+Volumes always start on an odd (right-hand) page of the full album so
+that the margins of a volume are the same as in the full album. As volumes
+do not share any state, they can be generated in parallel."""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import os.path
+import yaml
+
+
+class Volume:
+	"""A volume of the album."""
+
+	def __init__(self, album, number, pages):
+		self.album = album
+		self.number = number
+		self.pages = pages
+		root = os.path.splitext(album.path)[0]
+		self.root = f"{root}-{number + 1}"
+
+	def __repr__(self):
+		return f"volume {self.number + 1} " \
+			f"[{self.pages[0].number + 1}, {self.pages[-1].number + 1}]"
+
+	def get_pdf(self):
+		"""Get the name of PDF file of the volume."""
+		return os.path.basename(self.root) + ".pdf"
+
+
+def get_file_size(path):
+	"""Get the size of a file, 0 if it cannot be accessed."""
+	try:
+		return os.path.getsize(path)
+	except OSError:
+		return 0
+
+
+def split(album):
+	"""Split the album in volumes according to its max-pages-per-volume and
+	max-volume-bytes properties. Pages are grouped by spreads (odd and even
+	page) that are never split between volumes. The byte size of a volume
+	is estimated as the size of the distinct images it uses. A spread
+	exceeding alone the limits makes its own volume."""
+	max_pages = album.max_pages_per_volume
+	max_bytes = album.max_volume_bytes
+	pages = album.pages
+	if max_pages is None and max_bytes is None:
+		return [Volume(album, 0, pages)]
+
+	volumes = []
+	current = []
+	images = set()
+	size = 0
+	for i in range(0, len(pages), 2):
+		spread = pages[i:i+2]
+
+		# compute spread size
+		new_images = set()
+		for page in spread:
+			new_images.update(page.get_images())
+		new_images.difference_update(images)
+		new_size = sum(get_file_size(path) for path in new_images)
+
+		# need a new volume?
+		if current and (
+			(max_pages is not None and len(current) + len(spread) > max_pages)
+		or	(max_bytes is not None and size + new_size > max_bytes)):
+			volumes.append(Volume(album, len(volumes), current))
+			current = []
+			images = set()
+			new_images = set()
+			for page in spread:
+				new_images.update(page.get_images())
+			new_size = sum(get_file_size(path) for path in new_images)
+			size = 0
+
+		current += spread
+		images.update(new_images)
+		size += new_size
+
+	if current:
+		volumes.append(Volume(album, len(volumes), current))
+	return volumes
+
+
+def write_index(album, volumes):
+	"""Write the index file of the volumes of an album. Return the path
+	of the index file."""
+	root = os.path.splitext(album.path)[0]
+	path = root + "-index.yaml"
+	desc = {
+		"title": album.title,
+		"author": album.author,
+		"date": album.date,
+		"pages": len(album.pages),
+		"volumes": [
+			{
+				"file": volume.get_pdf(),
+				"first": volume.pages[0].number + 1,
+				"last": volume.pages[-1].number + 1,
+				"first-page": volume.pages[0].name,
+				"last-page": volume.pages[-1].name
+			}
+			for volume in volumes
+		]
+	}
+	with open(path, "w") as out:
+		yaml.safe_dump(desc, out, sort_keys=False, allow_unicode=True)
+	return path
+
+
+def gen(album, make_drawer, mon, jobs=1):
+	"""Generate the album, possibly split in volumes. make_drawer is called
+	with the album, the list of pages, the root of output files and the
+	monitor to obtain the drawer. jobs gives the number of volumes generated
+	in parallel. Raises graph.GenError if there is an error."""
+	volumes = split(album)
+	if len(volumes) == 1:
+		make_drawer(album, album.pages, None, mon).gen()
+		return
+
+	def build(volume):
+		make_drawer(album, volume.pages, volume.root, mon).gen()
+		mon.print_info(f"{volume} generated in {volume.get_pdf()}")
+
+	if jobs <= 1:
+		for volume in volumes:
+			build(volume)
+	else:
+		with ThreadPoolExecutor(max_workers=jobs) as pool:
+			for res in [pool.submit(build, volume) for volume in volumes]:
+				res.result()
+	path = write_index(album, volumes)
+	mon.print_info(f"{len(volumes)} volumes indexed in {path}")
@@ -26,17 +26,103 @@ TESTS = [
 	"back.ptah",
 	"border.ptah",
 	"colors.ptah",
+	"convert.ptah",
 	"default.ptah",
+	"filters.ptah",
+	"flow.ptah",
 	"font-test.ptah",
+	"include.ptah",
+	"mosaic.ptah",
+	"orientation.ptah",
 	"paths.ptah",
+	"profile.ptah",
 	"shadow.ptah",
+	"shadow-raster.ptah",
 	"styles.ptah",
 	"test.ptah",
-	"text.ptah"
+	"templates.ptah",
+	"text.ptah",
+	"tiles.ptah",
+	"volumes.ptah"
 ]
 FAILING = [
 ]
 
+STARTUP_FORBIDDEN = ["yaml", "PIL", "thot", "ptah.album", "ptah.latex"]
+"""Modules that must not be imported by ptah --version."""
+
+
+def test_startup():
+	"""Test that ptah --version does not import heavy modules. Return True
+	in case of success."""
+	print("Testing startup imports")
+	rc = subprocess.run(["python3", "-X", "importtime", "-m", "ptah", "--version"],
+		capture_output=True, text=True)
+	modules = {line.split("|")[-1].strip()
+		for line in rc.stderr.splitlines() if line.startswith("import time:")}
+	heavy = [module for module in STARTUP_FORBIDDEN if module in modules]
+	if rc.returncode:
+		print(f"{Fore.RED}Error: ptah --version failed{Style.RESET_ALL}")
+		return False
+	elif heavy:
+		print(f"{Fore.RED}Error: heavy modules imported: {', '.join(heavy)}{Style.RESET_ALL}")
+		return False
+	else:
+		print(f"{Fore.GREEN}Success!{Style.RESET_ALL}")
+		return True
+
+
+def test_schema():
+	"""Test that the schemas parse a value repeated in the album only
+	once. Return True in case of success."""
+	from ptah import props, schema
+	print("Testing schema parsing")
+	calls = []
+	class CountedProperty(props.Property):
+		def parse(self, val, obj, mon):
+			calls.append(val)
+			return props.Property.parse(self, val, obj, mon)
+	prop = CountedProperty("width", "counted width", props.parse_length)
+	compiled = schema.Schema(props.make(prop))
+	res = [compiled.parse(prop, "5mm", None, None) for _ in range(3)]
+	if calls != ["5mm"] or any(x is not res[0] for x in res):
+		print(f"{Fore.RED}Error: value parsed {len(calls)} times{Style.RESET_ALL}")
+		return False
+	else:
+		print(f"{Fore.GREEN}Success!{Style.RESET_ALL}")
+		return True
+
+
+TEXTS = [
+	("some *italic* and **bold**", "some \\textit{italic} and \\textbf{bold}"),
+	("_italic_ and __bold__", "\\textit{italic} and \\textbf{bold}"),
+	("**bold *italic***", "\\textbf{bold \\textit{italic}}"),
+	("***both***", "\\textbf{\\textit{both}}"),
+	("*italic **bold***", "\\textit{italic \\textbf{bold}}"),
+	("snake_case_name", "snake\\_case\\_name"),
+	("{}$&#^~%", "\\{\\}\\$\\&\\#\\textasciicircum{}\\textasciitilde{}\\%"),
+	("**unclosed and *unclosed", "**unclosed and *unclosed"),
+	("a * b", "a * b"),
+	("one\n\ntwo", "one\n\ntwo")
+]
+"""Texts of the Markdown subset and their expected rendering."""
+
+
+def test_text():
+	"""Test the rendering of the Markdown subset to LaTeX. Return True
+	in case of success."""
+	from ptah.text import render
+	print("Testing text rendering")
+	errors = [(text, render(text), res) for (text, res) in TEXTS if render(text) != res]
+	for (text, res, expected) in errors:
+		print(f"{Fore.RED}Error: {text!r} gives {res!r} instead of {expected!r}{Style.RESET_ALL}")
+	if errors:
+		return False
+	else:
+		print(f"{Fore.GREEN}Success!{Style.RESET_ALL}")
+		return True
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument("files", nargs="*", help="file to test with.")
 parser.add_argument("--failed", action="store_true", help="files must be failing.")
@@ -52,6 +138,16 @@ elif args.failed:
 
 cnt = 0
 failed = 0
+if not args.files:
+	cnt += 1
+	if not test_startup():
+		failed += 1
+	cnt += 1
+	if not test_schema():
+		failed += 1
+	cnt += 1
+	if not test_text():
+		failed += 1
 for test in files:
 	cnt += 1
 	print(f"Testing {test}")